@@ -0,0 +1,471 @@
+"""Count where pieces ended up, over a selection of games.
+
+Square columns hold row * 8 + col codes, -1 for a captured piece (see
+dataset.py). Counts are returned as flat arrays of 64, in board_output order:
+index 0 is A8, index 63 is H1.
+"""
+import numpy as np
+
+from dataset import MATERIAL_PIECES
+
+
+def board_counts(games, mask, columns):
+    """Counts of the squares in columns, over the games selected by mask."""
+    return fused_board_counts(games, [(columns, mask)])[0]
+
+
+def fused_board_counts(games, boards):
+    """Counts for several boards in a single pass over the games.
+
+    boards is a list of (columns, mask) pairs, one per board. Each column is
+    gathered once for the union of the masks, and all boards are counted by
+    one np.bincount over board * 64 + square keys.
+    Returns an array of shape (len(boards), 64).
+    """
+    union = np.logical_or.reduce([mask for _, mask in boards])
+    # Without a filter every row is selected: skip the gather.
+    rows = slice(None) if union.all() else np.flatnonzero(union)
+    gathered = {}
+    keys = []
+    for board, (columns, mask) in enumerate(boards):
+        selected = mask[rows]
+        for col in columns:
+            if col not in gathered:
+                gathered[col] = games[col].to_numpy()[rows]
+            squares = gathered[col][selected]
+            keys.append(squares[squares >= 0].astype(np.int32) + board * 64)
+    counts = np.bincount(np.concatenate(keys), minlength=len(boards) * 64)
+    return counts.reshape(len(boards), 64)
+
+
+def fused_winner_counts(games, masks):
+    """White wins, black wins and draws of each mask, in one np.bincount over
+    mask * 3 + winner_code keys. Returns an array of shape (len(masks), 3)."""
+    union = np.logical_or.reduce(masks)
+    rows = slice(None) if union.all() else np.flatnonzero(union)
+    winner = games["winner_code"].to_numpy()[rows].astype(np.int64)
+    keys = [winner[mask[rows]] + i * 3 for i, mask in enumerate(masks)]
+    counts = np.bincount(np.concatenate(keys), minlength=len(masks) * 3)
+    return counts.reshape(len(masks), 3)
+
+
+# Measures derived from count vectors, without going back to the games. Each
+# takes arrays of 64 counts (or stacks of them) and returns the same shape.
+def shares(counts):
+    """Percentage of the pieces of each board on each square."""
+    counts = np.asarray(counts, dtype=float)
+    totals = counts.sum(axis=-1, keepdims=True)
+    return np.divide(counts * 100, totals, out=np.zeros_like(counts), where=totals > 0)
+
+
+def log_counts(counts):
+    return np.log1p(counts)
+
+
+def lift(counts, baseline):
+    """Share of each square relative to its share in the baseline counts:
+    above 1 where the selection ends on the square more often than usual."""
+    selected, expected = shares(counts), shares(baseline)
+    return np.divide(selected, expected, out=np.zeros_like(selected), where=expected > 0)
+
+
+def difference(counts, other):
+    """Difference of the shares of each square, in percentage points."""
+    return shares(counts) - shares(other)
+
+
+# Pieces that deliver mate, in the order of the rows of mate_square_table.
+MATING_PIECES = ["Queen", "Rook", "Bishop", "Knight", "Pawn", "King"]
+
+
+def mate_square_table(games):
+    """Squares of the mated kings, precomputed when the games are loaded.
+
+    Returns read-only counts of shape (len(MATING_PIECES), 2, 64): by mating
+    piece, by winner (0 white, 1 black, as winner_code) and by square of the
+    losing king.
+    """
+    piece = (
+        games["mated_by"]
+        .map({name: i for i, name in enumerate(MATING_PIECES)})
+        .fillna(-1)
+        .to_numpy()
+        .astype(np.int64)
+    )
+    winner = games["winner_code"].to_numpy()
+    king = np.where(winner == 0, games["bKing_sqr"].to_numpy(), games["wKing_sqr"].to_numpy())
+    rows = (piece >= 0) & (winner < 2) & (king >= 0)
+    keys = (piece[rows] * 2 + winner[rows]) * 64 + king[rows]
+    table = np.bincount(keys, minlength=len(MATING_PIECES) * 2 * 64)
+    table = table.reshape(len(MATING_PIECES), 2, 64)
+    table.setflags(write=False)
+    return table
+
+
+def eco_square_table(games, columns):
+    """Counts of each square column by opening, precomputed when the games are
+    loaded. Returns {column: read-only array of shape (number of ECO codes, 64)},
+    indexed by the eco_code column (see dataset.build_indexes)."""
+    eco = games["eco_code"].to_numpy().astype(np.int64)
+    n_codes = len(games["ECO"].cat.categories)
+    table = {}
+    for col in columns:
+        squares = games[col].to_numpy()
+        rows = (eco >= 0) & (squares >= 0)
+        counts = np.bincount(eco[rows] * 64 + squares[rows], minlength=n_codes * 64)
+        table[col] = counts.reshape(n_codes, 64)
+        table[col].setflags(write=False)
+    return table
+
+
+def eco_board_counts(table, code, boards):
+    """Counts of the boards for the games of one opening, from eco_square_table.
+    boards is a list of column lists; returns an array of shape (len(boards), 64)."""
+    return np.array([sum(table[col][code] for col in columns) for columns in boards])
+
+
+def cell_totals(cells, n_cells, winner, moves):
+    """Results and moves range of the games by cell (e.g. an opening),
+    precomputed when the games are loaded. cells is the cell of each game,
+    -1 for none. Returns (results, moves): the white wins, black wins and draws
+    of each cell, shape (n_cells, 3), and its fewest and most moves, shape
+    (n_cells, 2), (int64 max, -1) for a cell without games."""
+    rows = cells >= 0
+    cells, winner, moves = cells[rows].astype(np.int64), winner[rows], moves[rows]
+    results = np.bincount(cells * 3 + winner, minlength=n_cells * 3).reshape(n_cells, 3)
+    fewest = np.full(n_cells, np.iinfo(np.int64).max)
+    most = np.full(n_cells, -1, dtype=np.int64)
+    np.minimum.at(fewest, cells, moves)
+    np.maximum.at(most, cells, moves)
+    results.setflags(write=False)
+    return results, np.column_stack([fewest, most])
+
+
+def eco_totals(table, code):
+    """Results and moves range of the games of one opening, from the
+    cell_totals of the openings, as [white, black, draw, fewest, most]."""
+    results, moves = table
+    return np.concatenate([results[code], moves[code]])
+
+
+def rating_square_table(games, columns, white_bins, black_bins, n_bins):
+    """Counts of each square column by white and black Elo bin, as prefix
+    sums, precomputed when the games are loaded.
+
+    white_bins and black_bins are the bins of each game, from 0 to n_bins - 1,
+    or -1 for an unknown rating. Returns {column: read-only array of shape
+    (n_bins + 1, n_bins + 1, 64)}: table[col][i, j] counts the games with a
+    white bin below i and a black bin below j.
+    """
+    rows = (white_bins >= 0) & (black_bins >= 0)
+    cells = (white_bins[rows].astype(np.int64) * n_bins + black_bins[rows]) * 64
+    table = {}
+    for col in columns:
+        squares = games[col].to_numpy()[rows]
+        placed = squares >= 0
+        counts = np.bincount(cells[placed] + squares[placed], minlength=n_bins * n_bins * 64)
+        prefix = np.zeros((n_bins + 1, n_bins + 1, 64), dtype=np.int64)
+        prefix[1:, 1:] = counts.reshape(n_bins, n_bins, 64).cumsum(axis=0).cumsum(axis=1)
+        table[col] = prefix
+        table[col].setflags(write=False)
+    return table
+
+
+def rating_board_counts(table, white, black, boards):
+    """Counts of the boards for the games with a white bin in white = (first,
+    stop) and a black bin in black, from rating_square_table: four lookups per
+    column, whatever the number of games. Returns an array of shape
+    (len(boards), 64)."""
+    return np.array(
+        [sum(_rectangle(table[col], white, black) for col in columns) for columns in boards]
+    )
+
+
+def rating_totals(table, white, black):
+    """Results and moves range of the games with a white bin in white = (first,
+    stop) and a black bin in black, from the prefix sums of the results and
+    the moves range of each pair of bins of dataset.rating_table, as
+    [white, black, draw, fewest, most]."""
+    (w0, w1), (b0, b1) = white, black
+    moves = table["moves"][w0:w1, b0:b1].reshape(-1, 2)
+    fewest = moves[:, 0].min(initial=np.iinfo(np.int64).max)
+    most = moves[:, 1].max(initial=-1)
+    return np.concatenate([_rectangle(table["results"], white, black), [fewest, most]])
+
+
+def _rectangle(prefix, white, black):
+    # Sum over a rectangle of bins, from four lookups in 2D prefix sums.
+    (w0, w1), (b0, b1) = white, black
+    return prefix[w1, b1] - prefix[w0, b1] - prefix[w1, b0] + prefix[w0, b0]
+
+
+def eco_options(games):
+    """Dropdown options for the openings, most played first. Each ECO code is
+    labelled with its most common opening name, when there is an Opening column."""
+    counts = games["eco_code"].value_counts()
+    counts = counts[counts.index >= 0]
+    names = {}
+    if "Opening" in games:
+        pairs = games.groupby(["eco_code", "Opening"], observed=True).size()
+        names = pairs.sort_values().groupby(level=0).tail(1).reset_index()
+        names = dict(zip(names["eco_code"], names["Opening"]))
+    categories = games["ECO"].cat.categories
+    options = []
+    for code, n_games in counts.items():
+        eco = categories[code]
+        name = f" {names[code]}" if code in names else ""
+        options.append({"label": f"{eco}{name} ({n_games} games)", "value": eco})
+    return options
+
+
+def square_index(games, columns):
+    """Inverted index from squares to games, built when the games are loaded.
+    Returns {column: (offsets, rows)}: the rows of the games with the piece of
+    column on square s are rows[offsets[s]:offsets[s + 1]], in increasing order."""
+    index = {}
+    for col in columns:
+        squares = games[col].to_numpy()
+        # A stable sort keeps the rows of each square in order.
+        rows = np.argsort(squares, kind="stable").astype(np.int32)
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(squares + 1, minlength=65))])
+        # Captured pieces (-1) sort first and are left out.
+        index[col] = (bounds[1:] - bounds[1], rows[bounds[1] :])
+        index[col][1].setflags(write=False)
+    return index
+
+
+def square_games(index, columns, square, mask):
+    """Rows of the games selected by mask with a piece of columns on square,
+    in increasing order. Only the rows of that square are read."""
+    parts = []
+    for col in columns:
+        offsets, rows = index[col]
+        parts.append(rows[offsets[square] : offsets[square + 1]])
+    rows = parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+    return rows[mask[rows]]
+
+
+def piece_groups(columns):
+    """The square columns of each piece of a side, e.g. {"wRook": ["wRook_sqr",
+    "wRook2_sqr"], ...}, in the order of columns."""
+    groups = {}
+    for col in columns:
+        groups.setdefault(col[: -len("_sqr")].rstrip("2"), []).append(col)
+    return groups
+
+
+def cooccurrence_table(games, groups, buckets, n_buckets):
+    """Joint counts of the squares of two pieces, precomputed when the games
+    are loaded.
+
+    groups is {name: columns}, as piece_groups, and buckets the bucket of each
+    game, from 0 to n_buckets - 1. Returns {(a, b): read-only uint32 array of
+    shape (n_buckets, 64, 64)} for each pair of names a, b with a not after b
+    in groups: table[a, b][k, s, t] counts the games of bucket k with a piece
+    of a on s and another piece of b on t.
+    """
+    names = list(groups)
+    # bucket * 64 * 64 + square * 64 of each column, -1 for captured pieces,
+    # computed once. Keys are below 2 ** 31 for any sensible n_buckets.
+    buckets = buckets.astype(np.int32) * 64 * 64
+    prefixes = {}
+    for columns in groups.values():
+        for col in columns:
+            squares = games[col].to_numpy()
+            prefixes[col] = np.where(squares >= 0, buckets + squares.astype(np.int32) * 64, -1)
+    table = {}
+    for i, a in enumerate(names):
+        for b in names[i:]:
+            keys = [np.empty(0, np.int32)]
+            for col_a in groups[a]:
+                for col_b in groups[b]:
+                    if col_b == col_a:
+                        continue
+                    squares_b = games[col_b].to_numpy()
+                    rows = (prefixes[col_a] >= 0) & (squares_b >= 0)
+                    keys.append(prefixes[col_a][rows] + squares_b[rows])
+            counts = np.bincount(np.concatenate(keys), minlength=n_buckets * 64 * 64)
+            table[a, b] = counts.astype(np.uint32).reshape(n_buckets, 64, 64)
+            table[a, b].setflags(write=False)
+    return table
+
+
+def conditional_counts(table, a, b, square, buckets):
+    """Counts of the squares of b in the games of buckets with a on square,
+    sliced from cooccurrence_table."""
+    if (a, b) in table:
+        counts = table[a, b][buckets, square, :]
+    else:
+        counts = table[b, a][buckets, :, square]
+    return counts.sum(axis=0, dtype=np.int64)
+
+
+def conditional_board_counts(games, index, mask, columns_a, square, columns_b):
+    """Counts of the squares of columns_b in the games of mask with a piece of
+    columns_a on square, for the selections the table does not cover. Only the
+    games of square_index are read."""
+    keys = [np.empty(0, np.int8)]
+    for col_a in columns_a:
+        rows = square_games(index, [col_a], square, mask)
+        for col_b in columns_b:
+            if col_b != col_a:
+                squares = games[col_b].to_numpy()[rows]
+                keys.append(squares[squares >= 0])
+    return np.bincount(np.concatenate(keys), minlength=64)
+
+
+# Material filters, on the signatures of dataset.material_signatures.
+def unpack_material(signatures):
+    """The counts of each piece type of signatures, as {"P": counts, ...}
+    (see MATERIAL_PIECES)."""
+    signatures = np.asarray(signatures)
+    return {piece: (signatures >> (4 * i)) & 15 for i, piece in enumerate(MATERIAL_PIECES)}
+
+
+def _pieces(side, pieces):
+    return sum(side[piece] for piece in pieces)
+
+
+def _only(side, pieces):
+    # Whether side has some of pieces, and no other pieces but pawns.
+    return (_pieces(side, pieces) > 0) & (_pieces(side, "NBRQ") == _pieces(side, pieces))
+
+
+# Value: (label, function of the unpacked white and black material).
+MATERIAL_FILTERS = {
+    "pawn": ("Pawn endings", lambda w, b: (_pieces(w, "NBRQ") == 0) & (_pieces(b, "NBRQ") == 0)),
+    "rook": ("Rook endings", lambda w, b: _only(w, "R") & _only(b, "R")),
+    "minor": ("Minor piece endings", lambda w, b: _only(w, "NB") & _only(b, "NB")),
+    "queen": ("Queen endings", lambda w, b: _only(w, "Q") & _only(b, "Q")),
+    "queen_rook": (
+        "Queen vs rook",
+        lambda w, b: (_only(w, "Q") & _only(b, "R")) | (_only(w, "R") & _only(b, "Q")),
+    ),
+    "rook_minor": (
+        "Rook vs minor piece",
+        lambda w, b: (_only(w, "R") & _only(b, "NB")) | (_only(w, "NB") & _only(b, "R")),
+    ),
+    "no_queens": ("No queens", lambda w, b: (w["Q"] == 0) & (b["Q"] == 0)),
+}
+
+
+def material_match(white, black, material):
+    """Whether each game of the white and black signatures matches material."""
+    return MATERIAL_FILTERS[material][1](unpack_material(white), unpack_material(black))
+
+
+def material_index(white, black):
+    """Index from material signatures to games, built when the games are loaded.
+    Returns (white, black, offsets, rows): the distinct pairs of signatures,
+    and the rows of the games of pair i, rows[offsets[i]:offsets[i + 1]], in
+    increasing order."""
+    keys = (white.astype(np.int64) << 32) | black.astype(np.int64)
+    rows = np.argsort(keys, kind="stable").astype(np.int32)
+    pairs, counts = np.unique(keys[rows], return_counts=True)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    rows.setflags(write=False)
+    return (pairs >> 32).astype(np.int32), (pairs & 0xFFFFFFFF).astype(np.int32), offsets, rows
+
+
+def material_rows(index, material, start=0, stop=None):
+    """Rows of the games matching material, between start and stop, in
+    increasing order. material is tested on the distinct signatures only, and
+    only the rows of the matching ones are read."""
+    white, black, offsets, rows = index
+    matches = np.flatnonzero(material_match(white, black, material))
+    parts = [rows[offsets[i] : offsets[i + 1]] for i in matches]
+    selected = np.sort(np.concatenate([np.empty(0, np.int32)] + parts))
+    stop = len(selected) if stop is None else np.searchsorted(selected, stop)
+    return selected[np.searchsorted(selected, start) : stop]
+
+
+def eco_index(codes, n_codes):
+    """Index from openings to games, built when the games are loaded. codes is
+    the eco_code column. Returns (offsets, rows): the rows of the games of
+    code c are rows[offsets[c]:offsets[c + 1]], in increasing order."""
+    rows = np.argsort(codes, kind="stable").astype(np.int32)
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes + 1, minlength=n_codes + 1))])
+    # Games without an opening (-1) sort first and are left out.
+    rows = rows[bounds[1] :]
+    rows.setflags(write=False)
+    return bounds[1:] - bounds[1], rows
+
+
+def eco_rows(index, code, start=0, stop=None):
+    """Rows of the games of the opening code, between start and stop, in
+    increasing order. Only the rows of that opening are read."""
+    offsets, rows = index
+    selected = rows[offsets[code] : offsets[code + 1]]
+    stop = len(selected) if stop is None else np.searchsorted(selected, stop)
+    return selected[np.searchsorted(selected, start) : stop]
+
+
+# Stratified sampling, for approximate boards on large datasets.
+TIME_CONTROLS = ["Bullet", "Blitz", "Classical", "Correspondence"]
+
+
+def filter_strata(games, elo_band=200):
+    """Stratum of each game: one per combination of the values of the
+    update_chessboard filters (status, winner, time control, game type) and
+    of an Elo band, numbered from 0."""
+    # Event has few distinct values, so it is parsed once per value.
+    events = games["Event"].astype("category")
+    names = events.cat.categories.to_series()
+    time_control = np.select(
+        [names.str.contains(name).to_numpy() for name in TIME_CONTROLS],
+        range(len(TIME_CONTROLS)),
+        len(TIME_CONTROLS),
+    )
+    tournament = names.str.contains("tournament").to_numpy()
+    event = (time_control * 2 + tournament)[events.cat.codes.to_numpy()]
+    elo = (games["avg_Elo"].to_numpy() // elo_band).astype(np.int64)
+    elo -= elo.min()
+    keys = (games["status_code"].to_numpy() * 3 + games["winner_code"].to_numpy()).astype(np.int64)
+    keys = (keys * (len(TIME_CONTROLS) + 1) * 2 + event) * (elo.max() + 1) + elo
+    return np.unique(keys, return_inverse=True)[1]
+
+
+def stratified_sample(strata, size, min_per_stratum=5, seed=0):
+    """A random sample of about size games, drawn from each stratum in
+    proportion to its size but at least min_per_stratum games (or all of them).
+    Returns a dict with the sampled rows, the weight of each (the number of
+    games it stands for), their strata, and the size and sample size of each stratum.
+    """
+    sizes = np.bincount(strata)
+    quota = np.minimum(
+        sizes, np.maximum(min_per_stratum, np.round(size * sizes / len(strata)))
+    ).astype(np.int64)
+    rng = np.random.default_rng(seed)
+    # Shuffle within strata, then keep the first quota games of each.
+    order = np.lexsort((rng.random(len(strata)), strata))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(len(strata)) - starts[strata[order]]
+    rows = np.sort(order[rank < quota[strata[order]]])
+    return {
+        "rows": rows,
+        "weights": (sizes / quota)[strata[rows]],
+        "strata": strata[rows],
+        "sizes": sizes,
+        "quota": quota,
+    }
+
+
+def weighted_board_counts(games, mask, columns, weights):
+    """Estimated counts of the squares in columns, from sampled games with weights."""
+    counts = np.zeros(64)
+    for col in columns:
+        squares = games[col].to_numpy()
+        rows = mask & (squares >= 0)
+        counts += np.bincount(squares[rows], weights=weights[rows], minlength=64)
+    return counts
+
+
+def estimate_count(sample, mask):
+    """Estimate and standard error of the number of games selected, from the
+    mask over the games of a stratified_sample."""
+    sizes, quota = sample["sizes"], sample["quota"]
+    share = np.bincount(sample["strata"], weights=mask, minlength=len(sizes)) / quota
+    variance = (
+        sizes ** 2 * (1 - quota / sizes) * share * (1 - share) / np.maximum(quota - 1, 1)
+    )
+    return float((sizes * share).sum()), float(np.sqrt(variance.sum()))
@@ -1,68 +1,280 @@
 # Imports
-import dash
 import ast
+import collections
+import functools
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import urllib.parse
+import uuid
+
+import dash
 
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from flask import Response, jsonify, redirect, request
+from flask_compress import Compress
 
-import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objs as go
+import plotly
 from whitenoise import WhiteNoise
 
-from chessboard import getChessboard, getHeatmap, getStackedBar, getBoard
+import dataset
+import export
+import jobs
+import monitoring
+import serialization
+from aggregates import (
+    MATERIAL_FILTERS,
+    MATING_PIECES,
+    conditional_board_counts,
+    conditional_counts,
+    difference,
+    eco_board_counts,
+    eco_rows,
+    eco_totals,
+    estimate_count,
+    fused_board_counts,
+    fused_winner_counts,
+    lift,
+    log_counts,
+    material_match,
+    material_rows,
+    piece_groups,
+    rating_board_counts,
+    rating_totals,
+    shares,
+    square_games,
+    weighted_board_counts,
+)
+from chessboard import (
+    getChessboardDict,
+    getHeatmapDict,
+    getMeasureHeatmapDict,
+    getStackedBarDict,
+)
 from styles import *
 
-# Read the .csv file with the preprocessed data.
-url = "https://raw.githubusercontent.com/Exileus/DataVis2021_proj2/main/chess_app.csv"
-df_original = pd.read_csv(
-    url,
-    sep=",",
-    dtype={"pawns": int, "knights": int, "bishops": int, "rooks": int, "queens": int},
-    converters={
-        "wKing_sqr": ast.literal_eval,
-        "bKing_sqr": ast.literal_eval,
-        "wQueen_sqr": ast.literal_eval,
-        "bQueen_sqr": ast.literal_eval,
-        "wRook_sqr": ast.literal_eval,
-        "bRook_sqr": ast.literal_eval,
-        "wRook2_sqr": ast.literal_eval,
-        "bRook2_sqr": ast.literal_eval,
-        "wBishop_sqr": ast.literal_eval,
-        "bBishop_sqr": ast.literal_eval,
-        "wBishop2_sqr": ast.literal_eval,
-        "bBishop2_sqr": ast.literal_eval,
-        "wKnight_sqr": ast.literal_eval,
-        "bKnight_sqr": ast.literal_eval,
-        "wKnight2_sqr": ast.literal_eval,
-        "bKnight2_sqr": ast.literal_eval,
-    },
-)
-max_moves = df_original["moves"].max()
-min_elo, max_elo = df_original["avg_Elo"].min(), df_original["avg_Elo"].max()
-
-# Define function to output an 8*8 dataframe based on a df and a list of column names to parse.
-
-
-def board_output(df, col_list):
-    brd = np.zeros((8, 8))
-    for col_name in col_list:
-        for tup in df[col_name]:
-            if tup == (None, None):
-                pass
-            else:
-                brd[tup] += 1
-
-    return pd.DataFrame(brd)
-
-
-# Define global variables for later.
-g_color = "white_color"
-g_piece = "King"
-g_status, g_winner, g_time_control, g_game_type = ".*", ".*", ".*", ".*"
+logger = logging.getLogger(__name__)
+
+# The preprocessed data is read in the background (see dataset.py), so the
+# layout can be served before it is available.
+dataset.start_loading()
+
+# Slider bounds used until the dataset is loaded. They must contain the real
+# ranges, so that the first update after loading does not filter anything out.
+placeholder_elo = (0, 4000)
+placeholder_moves = 1000
+data_poll_interval = 500  # ms
+
+# The sliders update the board when released. With CHESS_SLIDER_THROTTLE_MS > 0
+# the board also follows the slider while it is dragged, at most once per
+# that many milliseconds (see slider_live).
+slider_throttle = int(os.environ.get("CHESS_SLIDER_THROTTLE_MS", "0"))
+filter_cache_size = 128
+# Queries scanning more than CHESS_JOB_MIN_ROWS rows (counted once per board)
+# run as background jobs, so they do not hold a server thread (see jobs.py).
+job_min_rows = int(os.environ.get("CHESS_JOB_MIN_ROWS", "2000000"))
+job_poll_interval = 500  # ms
+scan_chunk_rows = 1000000
+# Share of the date range under which filter_mask reads the rows of the
+# opening and material indexes rather than scanning the range.
+index_gather_share = 0.02
+
+# Board sizes in pixels, for a single board and for each of the two boards
+# of the comparison view. Heatmap squares scale with the board.
+board_dimensions = 800
+compare_dimensions = 420
+mates_dimensions = 300
+# Openings listed at once in the opening dropdown, which is searched on the server.
+eco_option_limit = 50
+heatmap_max_size = 60
+# Formats of the downloads of the selection (see export.py).
+export_formats = ["csv"] + (["parquet"] if export.has_parquet() else [])
+export_mimetypes = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+# Views rendered by update_chessboard, kept by URL (see cached_view).
+view_cache_size = 256
+# Seconds that browsers and CDNs may keep a /view.json response.
+view_max_age = 300
+# Queries accepted in one request of the JSON API (see api_heatmaps).
+api_max_queries = 64
+# Games listed per page when a square is clicked, and their columns.
+drilldown_page_size = 10
+drilldown_columns = {
+    "Unnamed: 0": "Game",
+    "UTCDate": "Date",
+    "Event": "Event",
+    "TimeControl": "Time control",
+    "Winner": "Winner",
+    "victory_status": "Status",
+    "moves": "Moves",
+    "avg_Elo": "Elo",
+    "endFEN": "Final position",
+}
+
+# Define function to select games by all filters but the dates, as a numpy mask.
+def select_games(
+    games,
+    elo_min,
+    elo_max,
+    moves_min,
+    moves_max,
+    status,
+    winner,
+    time_control,
+    game_type,
+    eco,
+    material=None,
+    white_elo=None,
+    black_elo=None,
+    elo_difference=None,
+):
+    selected = (
+        (games["avg_Elo"] >= elo_min)
+        & (games["avg_Elo"] <= elo_max)
+        & (games["moves"] >= moves_min)
+        & (games["moves"] <= moves_max)
+    ).to_numpy()
+    # ".*" matches every game: skip the regular expression.
+    for column, pattern in [
+        ("victory_status", status),
+        ("Winner", winner),
+        ("Event", time_control),
+        ("Event", game_type),
+    ]:
+        if pattern != ".*":
+            selected &= games[column].str.contains(pattern).to_numpy()
+    # ECO is categorical: this compares integer codes.
+    if eco is not None:
+        selected &= (games["ECO"] == eco).to_numpy()
+    if material is not None:
+        selected &= material_match(
+            games["w_material"].to_numpy(), games["b_material"].to_numpy(), material
+        )
+    # Rating ranges include their first value, not their last (see rating_filters).
+    # Any of them leaves out the games without both ratings, as the rating
+    # tables do (see dataset.rating_table).
+    if white_elo is not None or black_elo is not None or elo_difference is not None:
+        white = games["WhiteElo"].to_numpy(dtype=float)
+        black = games["BlackElo"].to_numpy(dtype=float)
+        selected &= np.isfinite(white) & np.isfinite(black)
+        for values, bounds in [
+            (white, white_elo),
+            (black, black_elo),
+            (white - black, elo_difference),
+        ]:
+            if bounds is not None:
+                selected &= (values >= bounds[0]) & (values < bounds[1])
+    return selected
+
+
+def date_span(date_start, date_end):
+    # Games are sorted by date: only the rows of the date range are scanned.
+    if dataset.has_dates():
+        rows = dataset.date_rows(date_start, date_end)
+        return range(rows.start, rows.stop)
+    return range(dataset.row_count())
+
+
+def filter_rows(eco, material, date_start, date_end):
+    """Rows that may match the filters, in increasing order: the rows of the
+    opening and material indexes in the date range, as an array, or the
+    range of the dates when neither is filtered."""
+    span = date_span(date_start, date_end)
+    indexed = []
+    if material is not None:
+        table = dataset.get_table("material_index")
+        indexed.append(material_rows(table, material, span.start, span.stop))
+    if eco is not None and dataset.has_openings():
+        code = eco_code(eco)
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        indexed.append(eco_rows(dataset.get_table("eco_index"), code, span.start, span.stop))
+    if not indexed:
+        return span
+    return functools.reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), indexed)
+
+
+def gather_rows(rows, span):
+    # Gathering rows copies the games: past index_gather_share of the date
+    # range, scanning the range is faster.
+    return not isinstance(rows, range) and len(rows) <= index_gather_share * len(span)
+
+
+def eco_code(eco):
+    # Index of an ECO code in the eco_code column, None if no game has it.
+    categories = dataset.get_data()["ECO"].cat.categories
+    return categories.get_loc(eco) if eco in categories else None
+
+
+# Define a cached function for the filters, shared by all sessions of this worker.
+# The returned mask is read-only since it is shared between requests.
+@functools.lru_cache(maxsize=filter_cache_size)
+def filter_mask(
+    elo_min,
+    elo_max,
+    moves_min,
+    moves_max,
+    status,
+    winner,
+    time_control,
+    game_type,
+    eco=None,
+    material=None,
+    white_elo=None,
+    black_elo=None,
+    elo_difference=None,
+    date_start=None,
+    date_end=None,
+):
+    df_original = dataset.get_data()
+    rows = filter_rows(eco, material, date_start, date_end)
+    mask = np.zeros(len(df_original), dtype=bool)
+    if not isinstance(rows, range):
+        filters = (elo_min, elo_max, moves_min, moves_max, status, winner, time_control, game_type)
+        filters += (eco, material, white_elo, black_elo, elo_difference, date_start, date_end)
+        # The rows of the indexes are the games, when no other filter is set.
+        if unfiltered(filters, keep=[8, 9, 13, 14]):
+            mask[rows] = True
+            mask.setflags(write=False)
+            return mask
+        span = date_span(date_start, date_end)
+        if gather_rows(rows, span):
+            eco = material = None
+        else:
+            rows = span
+    # In chunks, so that background jobs report their progress (see jobs.py).
+    for start in range(0, len(rows), scan_chunk_rows):
+        chunk = rows[start : start + scan_chunk_rows]
+        # Ranges are read as slices, without copying the games.
+        if isinstance(chunk, range):
+            chunk = slice(chunk.start, chunk.stop)
+        mask[chunk] = select_games(
+            df_original.iloc[chunk],
+            elo_min,
+            elo_max,
+            moves_min,
+            moves_max,
+            status,
+            winner,
+            time_control,
+            game_type,
+            eco,
+            material,
+            white_elo,
+            black_elo,
+            elo_difference,
+        )
+        jobs.checkpoint(min(start + scan_chunk_rows, len(rows)), len(rows))
+    mask.setflags(write=False)
+    return mask
+
+
 pieces_list = ["King", "Queen", "Rook", "Bishop", "Knight"]
 # Define a dictionary to be used to update the board with the correct columns.
 color_piece_dict = cp_dict = {
@@ -108,16 +320,94 @@ dropdown_game_type_dict = gt_dict = {
     "gt_tourney": "tournament",
 }
 
+# Define a dict for the comparison view: what the second board shows.
+dropdown_compare_dict = cmp_dict = {
+    "cmp_off": None,
+    "cmp_colors": "colors",
+    "cmp_elo": "elo",
+    "cmp_status": "status",
+}
+
+# Define a dict for the heatmap modes. Except for counts they are derived from
+# the cached count vectors of the boards (see board_vectors).
+dropdown_heatmap_dict = hm_dict = {
+    "hm_counts": "counts",
+    "hm_log": "log",
+    "hm_lift": "lift",
+    "hm_diff": "difference",
+}
+
 # Set stylesheets and app.
 # ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
 FA = "https://use.fontawesome.com/releases/v5.12.1/css/all.css"
 external_stylesheets = [dbc.themes.LUX, FA]
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+app = dash.Dash(__name__, compress=False, external_stylesheets=external_stylesheets)
 app.title = "CHESS KINGDOM"
 server = app.server
+# Compress responses, with brotli when the browser supports it. Dash would
+# only enable gzip, so Flask-Compress is set up here instead. A low brotli
+# level keeps compression cheaper than the default level 11.
+server.config.update(
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_BR_LEVEL=4,
+    COMPRESS_MIN_SIZE=500,
+)
+Compress(server)
+serialization.use_fast_json()
 server.wsgi_app = WhiteNoise(server.wsgi_app, root="static/")
 
 
+monitoring.instrument(server)
+
+
+@server.route("/healthz")
+def healthz():
+    return jsonify(status="ok")
+
+
+@server.route("/readyz")
+def readyz():
+    # Ready once the dataset is loaded and its square columns are encoded.
+    status = dataset.status()
+    return (
+        jsonify(status=status, rows=dataset.row_count()),
+        200 if status == "ready" else 503,
+    )
+
+
+monitoring.Gauge(
+    "chess_dataset_ready", "1 once the dataset is loaded and indexed.", lambda: int(dataset.is_ready())
+)
+monitoring.Gauge("chess_dataset_rows", "Number of games in the dataset.", dataset.row_count)
+monitoring.Gauge(
+    "chess_filter_cache_hits_total",
+    "Filter mask cache hits.",
+    lambda: filter_mask.cache_info().hits,
+    kind="counter",
+)
+monitoring.Gauge(
+    "chess_filter_cache_misses_total",
+    "Filter mask cache misses.",
+    lambda: filter_mask.cache_info().misses,
+    kind="counter",
+)
+monitoring.Gauge(
+    "chess_filter_cache_size", "Entries in the filter mask cache.", lambda: filter_mask.cache_info().currsize
+)
+monitoring.Gauge(
+    "chess_board_cache_hits_total",
+    "Board count vector cache hits.",
+    lambda: board_vectors.cache_info().hits,
+    kind="counter",
+)
+monitoring.Gauge(
+    "chess_board_cache_misses_total",
+    "Board count vector cache misses.",
+    lambda: board_vectors.cache_info().misses,
+    kind="counter",
+)
+
+
 # Defining app layout
 margin_bottom = "30px"
 
@@ -145,23 +435,65 @@ banner = dbc.Row(
 )
 
 # Graph
+def make_board(board_id):
+    return dcc.Graph(
+        id=board_id,
+        animate=True,
+        style={
+            "margin-left": "auto",
+            "margin-right": "auto",
+            "background-color": "lightgray",
+        },
+        config={
+            "displayModeBar": False,
+            "scrollZoom": False,
+            "showAxisDragHandles": False,
+        },
+    )
+
+
+# The second board is only shown in the comparison view.
 graph = dbc.Row(
     style={"margin-bottom": "30px", "margin-left": "auto", "margin-right": "auto"},
     children=[
-        dcc.Graph(
-            id="chessboard",
-            animate=True,
-            style={
-                "margin-left": "auto",
-                "margin-right": "auto",
-                "background-color": "lightgray",
-            },
-            config={
-                "displayModeBar": False,
-                "scrollZoom": False,
-                "showAxisDragHandles": False,
-            },
-        )
+        dbc.Col(
+            children=[
+                html.Div(id="chessboard_label", style={"text-align": "center"}),
+                # On large datasets an approximate board covers the board
+                # until the exact one arrives (see approximate_chessboard).
+                html.Div(
+                    style={"position": "relative"},
+                    children=[
+                        make_board("chessboard"),
+                        html.Div(
+                            id="approx_overlay",
+                            style={"display": "none"},
+                            children=[make_board("chessboard_approx")],
+                        ),
+                    ],
+                ),
+                html.Div(
+                    id="approx_indicator", style={"display": "none", "text-align": "center"}
+                ),
+                # Progress of the board while it is computed in the background.
+                html.Div(
+                    id="job_status",
+                    style={"display": "none"},
+                    children=[
+                        html.Div("COMPUTING THE BOARD...", style={"text-align": "center"}),
+                        dbc.Progress(id="job_progress", value=0, striped=True, animated=True),
+                    ],
+                ),
+            ]
+        ),
+        dbc.Col(
+            id="compare_col",
+            style={"display": "none"},
+            children=[
+                html.Div(id="chessboard_compare_label", style={"text-align": "center"}),
+                make_board("chessboard_compare"),
+            ],
+        ),
     ],
 )
 
@@ -299,61 +631,116 @@ c_select_piece = dbc.Col(
         ),
     ],
 )
-c_elo_slider = dbc.Col(
-    style={
-        "margin-bottom": margin_bottom,
-        "margin-left": "auto",
-        "margin-right": "auto",
-    },
-    width=12,
-    children=[
-        html.Div(
-            str("Elo range").upper(),
-            style={"text-align": "center", "margin-bottom": text_margin},
-        ),
-        dcc.RangeSlider(
-            id="elo_slider",
-            min=min_elo,
-            max=max_elo,
-            value=[min_elo, max_elo],
-            step=10,
-            pushable=1,
-            allowCross=False,
-            marks={
-                i: str(i)
-                for i in range(
-                    int(min_elo) - 1,
-                    int(max_elo) + 1,
-                    int((max_elo - min_elo + 2) // 10),
-                )
-            },
-        ),
-    ],
-)
-c_moves_slider = dbc.Col(
-    style={
-        "margin-bottom": margin_bottom,
-        "margin-left": "auto",
-        "margin-right": "auto",
-    },
-    width=12,
-    children=[
-        html.Div(
-            str("Number of Moves").upper(),
-            style={"text-align": "center", "margin-bottom": text_margin},
-        ),
-        dcc.RangeSlider(
-            id="moves_slider",
-            min=1,
-            max=max_moves,
-            value=[0, max_moves],
-            step=1,
-            pushable=1,
-            allowCross=False,
-            marks={i: str(i) for i in range(0, max_moves, 5)},
-        ),
-    ],
-)
+def elo_marks(min_elo, max_elo):
+    return {
+        i: str(i)
+        for i in range(
+            int(min_elo) - 1,
+            int(max_elo) + 1,
+            int((max_elo - min_elo + 2) // 10),
+        )
+    }
+
+
+def moves_marks(max_moves):
+    return {i: str(i) for i in range(0, max_moves, 5)}
+
+
+def make_elo_slider(min_elo, max_elo):
+    return dbc.Col(
+        style={
+            "margin-bottom": margin_bottom,
+            "margin-left": "auto",
+            "margin-right": "auto",
+        },
+        width=12,
+        children=[
+            html.Div(
+                str("Elo range").upper(),
+                style={"text-align": "center", "margin-bottom": text_margin},
+            ),
+            dcc.RangeSlider(
+                id="elo_slider",
+                min=min_elo,
+                max=max_elo,
+                value=[min_elo, max_elo],
+                step=10,
+                pushable=1,
+                allowCross=False,
+                updatemode="mouseup",
+                marks=elo_marks(min_elo, max_elo),
+            ),
+        ],
+    )
+
+
+def make_moves_slider(max_moves):
+    return dbc.Col(
+        style={
+            "margin-bottom": margin_bottom,
+            "margin-left": "auto",
+            "margin-right": "auto",
+        },
+        width=12,
+        children=[
+            html.Div(
+                str("Number of Moves").upper(),
+                style={"text-align": "center", "margin-bottom": text_margin},
+            ),
+            dcc.RangeSlider(
+                id="moves_slider",
+                min=1,
+                max=max_moves,
+                value=[0, max_moves],
+                step=1,
+                pushable=1,
+                allowCross=False,
+                updatemode="mouseup",
+                marks=moves_marks(max_moves),
+            ),
+        ],
+    )
+
+
+# Ratings of each side and their difference, enabled by update_rating_bounds
+# when the games have WhiteElo and BlackElo. Ranges exclude their last value.
+rating_sliders = [
+    ("white_elo_slider", "White Elo", dataset.rating_bin),
+    ("black_elo_slider", "Black Elo", dataset.rating_bin),
+    ("elo_difference_slider", "Elo difference (white - black)", dataset.difference_step),
+]
+
+
+def make_rating_slider(slider_id, label, step):
+    return dbc.Col(
+        style={
+            "margin-bottom": margin_bottom,
+            "margin-left": "auto",
+            "margin-right": "auto",
+        },
+        width=12,
+        children=[
+            html.Div(
+                str(label).upper(),
+                style={"text-align": "center", "margin-bottom": text_margin},
+            ),
+            dcc.RangeSlider(
+                id=slider_id,
+                min=0,
+                max=step,
+                step=step,
+                pushable=1,
+                allowCross=False,
+                updatemode="mouseup",
+                disabled=True,
+            ),
+        ],
+    )
+
+
+def rating_marks(first, stop, step):
+    return {i: str(i) for i in range(first, stop + 1, step)}
+
 
 dropdown_status = dbc.DropdownMenu(
     [
@@ -414,6 +801,107 @@ dropdown_game_type = dbc.DropdownMenu(
     id="dropdown_game_type",
 )
 
+dropdown_compare = dbc.DropdownMenu(
+    [
+        dbc.DropdownMenuItem(str("Compare").upper(), header=True),
+        dbc.DropdownMenuItem(str("Single Board").upper(), id="cmp_off", n_clicks=0),
+        dbc.DropdownMenuItem(str("White vs Black").upper(), id="cmp_colors", n_clicks=0),
+        dbc.DropdownMenuItem(str("Lower vs Upper Elo").upper(), id="cmp_elo", n_clicks=0),
+        dbc.DropdownMenuItem(
+            str("Checkmate vs Resignation").upper(), id="cmp_status", n_clicks=0
+        ),
+    ],
+    label="Compare",
+    id="dropdown_compare",
+)
+
+dropdown_heatmap = dbc.DropdownMenu(
+    [
+        dbc.DropdownMenuItem(str("Heatmap").upper(), header=True),
+        dbc.DropdownMenuItem(str("Games").upper(), id="hm_counts", n_clicks=0),
+        dbc.DropdownMenuItem(str("Games (log scale)").upper(), id="hm_log", n_clicks=0),
+        dbc.DropdownMenuItem(str("Lift over all games").upper(), id="hm_lift", n_clicks=0),
+        dbc.DropdownMenuItem(str("Difference").upper(), id="hm_diff", n_clicks=0),
+    ],
+    label="Heatmap",
+    id="dropdown_heatmap",
+)
+
+# Opening filter. Its options are filled in by search_openings as the user types.
+dropdown_eco = dbc.Row(
+    style={"margin-bottom": margin_bottom},
+    justify="center",
+    children=[
+        dbc.Col(
+            width=10,
+            children=[
+                html.Div(
+                    str("Opening").upper(),
+                    style={"text-align": "center", "margin-bottom": text_margin},
+                ),
+                dcc.Dropdown(
+                    id="eco_dropdown",
+                    options=[],
+                    searchable=True,
+                    clearable=True,
+                    placeholder=str("All openings (type an ECO code or a name)").upper(),
+                ),
+            ],
+        )
+    ],
+)
+
+# Material filter, e.g. rook endings, enabled when the games have final positions.
+dropdown_material = dbc.Row(
+    style={"margin-bottom": margin_bottom},
+    justify="center",
+    children=[
+        dbc.Col(
+            width=10,
+            children=[
+                html.Div(
+                    str("Material").upper(),
+                    style={"text-align": "center", "margin-bottom": text_margin},
+                ),
+                dcc.Dropdown(
+                    id="material_dropdown",
+                    options=[
+                        {"label": label.upper(), "value": value}
+                        for value, (label, _) in MATERIAL_FILTERS.items()
+                    ],
+                    clearable=True,
+                    disabled=True,
+                    placeholder=str("All material").upper(),
+                ),
+            ],
+        )
+    ],
+)
+
+# Date filter, enabled by update_date_bounds when the games have dates.
+date_range = dbc.Row(
+    style={"margin-bottom": margin_bottom},
+    justify="center",
+    children=[
+        dbc.Col(
+            width=10,
+            style={"text-align": "center"},
+            children=[
+                html.Div(
+                    str("Dates").upper(),
+                    style={"text-align": "center", "margin-bottom": text_margin},
+                ),
+                dcc.DatePickerRange(
+                    id="date_range",
+                    disabled=True,
+                    clearable=True,
+                    display_format="YYYY-MM-DD",
+                ),
+            ],
+        )
+    ],
+)
+
 dropdown_states = dbc.Row(
     justify="center",
     children=[
@@ -421,6 +909,8 @@ dropdown_states = dbc.Row(
         html.Tbody("xsxsxs", id="g_winner", style={"margin": "10px"}),
         html.Tbody("xsxsxs", id="g_time_control", style={"margin": "10px"}),
         html.Tbody(children="111", id="g_game_type", style={"margin": "10px"}),
+        html.Tbody(id="g_compare", style={"margin": "10px"}),
+        html.Tbody(id="g_heatmap", style={"margin": "10px"}),
     ],
 )
 
@@ -460,6 +950,30 @@ popover_game_type = dbc.Popover(
     placement="left",
 )
 
+popover_compare = dbc.Popover(
+    [
+        dbc.PopoverHeader("Compare Two Boards"),
+        dbc.PopoverBody(
+            "Show a second board next to the first: the same piece for both sides, the games below and above the middle of the Elo range, or games ended by checkmate and by resignation. Both boards use the same scale."
+        ),
+    ],
+    trigger="hover",
+    target="dropdown_compare",
+    placement="left",
+)
+
+popover_heatmap = dbc.Popover(
+    [
+        dbc.PopoverHeader("Heatmap Scale"),
+        dbc.PopoverBody(
+            "Size the squares by the share of games, by the number of games on a log scale, by the lift over all games (how many times more often than usual the piece ends there), or by the difference between the two compared boards (between the selection and all games with a single board). Red squares are above, blue squares below."
+        ),
+    ],
+    trigger="hover",
+    target="dropdown_heatmap",
+    placement="left",
+)
+
 about_this = dbc.Row(
     justify="end",
     children=[
@@ -490,43 +1004,728 @@ dropdown_menus = dbc.Row(
         popover_time_control,
         dropdown_game_type,
         popover_game_type,
+        dropdown_compare,
+        popover_compare,
+        dropdown_heatmap,
+        popover_heatmap,
     ],
 )
 
+# Checkmates: where the losing king stands, by mating piece. The boards are
+# read from a table precomputed at load time, and only once the section is opened.
+mates_winner_dict = {"all": [0, 1], "white": [0], "black": [1]}
+
+# Downloads of the selection shown on the board.
+export_links = html.Div(
+    id="export_links",
+    style={"display": "none"},
+    children=["DOWNLOAD: "]
+    + [
+        html.A(
+            f"{kind} ({file_format})".upper(),
+            id=f"export_{kind}_{file_format}",
+            download=f"chess_{kind}.{file_format}",
+            style={"margin-right": "15px"},
+        )
+        for kind in ["games", "board"]
+        for file_format in export_formats
+    ],
+)
 
-app.layout = dbc.Jumbotron(
-    style={"background-color": "#ebebeb"},  # ADD SETTINGS HERE
+
+# Games of a clicked square, a page at a time.
+drilldown_section = html.Div(
+    id="drilldown_section",
+    style={"display": "none"},
     children=[
-        # Banner
-        # Main Layout
-        dbc.Row(  # ADD SETTINGS HERE
+        dcc.Store(id="drilldown"),
+        html.Div(id="drilldown_label", style={"text-align": "center"}),
+        html.Div(id="drilldown_table", style={"overflow-x": "auto"}),
+        dbc.Row(
+            justify="center",
+            children=[
+                dbc.Button("<", id="drilldown_prev", n_clicks=0),
+                html.Div(id="drilldown_page", style={"margin": "0px 20px"}),
+                dbc.Button(">", id="drilldown_next", n_clicks=0),
+            ],
+        ),
+        # Where another piece is when the piece is on the clicked square.
+        dbc.Row(
+            justify="center",
+            style={"margin-top": "20px"},
             children=[
-                # PARAMETER SETTINGS COLUMN
                 dbc.Col(
+                    width=6,
+                    children=[
+                        dcc.Dropdown(
+                            id="condition_piece",
+                            options=[
+                                {
+                                    "label": f"{color.split('_')[0]} {piece}".upper(),
+                                    "value": f"{color} {piece}",
+                                }
+                                for color, piece in cp_dict
+                            ],
+                            value="black_color King",
+                            clearable=False,
+                        )
+                    ],
+                )
+            ],
+        ),
+        html.Div(id="conditional_label", style={"text-align": "center"}),
+        make_board("conditional_board"),
+    ],
+)
+
+
+mates_section = dbc.Row(
+    style={"margin-top": margin_bottom},
+    justify="center",
+    children=[
+        dbc.Col(
+            width=12,
+            children=[
+                dbc.Row(
+                    justify="center",
                     children=[
-                        banner,
-                        c_total_games,
-                        stacked_graph,
+                        dbc.Button(
+                            str("Where are kings mated?").upper(),
+                            id="mates_button",
+                            n_clicks=0,
+                        )
+                    ],
+                ),
+                dbc.Collapse(
+                    id="mates_collapse",
+                    children=[
+                        dbc.Row(
+                            justify="center",
+                            style={"margin": "20px"},
+                            children=[
+                                dbc.RadioItems(
+                                    id="mates_winner",
+                                    options=[
+                                        {"label": str("All").upper(), "value": "all"},
+                                        {"label": str("White wins").upper(), "value": "white"},
+                                        {"label": str("Black wins").upper(), "value": "black"},
+                                    ],
+                                    value="all",
+                                    inline=True,
+                                )
+                            ],
+                        ),
                         dbc.Row(
-                            style={"margin-bottom": margin_bottom},
-                            children=[c_choose_side, c_select_piece],
+                            justify="center",
+                            children=[
+                                dbc.Col(
+                                    width=4,
+                                    children=[
+                                        html.Div(
+                                            id=f"mates_label_{piece}",
+                                            style={"text-align": "center"},
+                                        ),
+                                        make_board(f"mates_{piece}"),
+                                    ],
+                                )
+                                for piece in MATING_PIECES
+                            ],
                         ),
-                        c_elo_slider,
-                        c_moves_slider,
-                        dropdown_menus,
-                        dropdown_states,
-                    ]
+                    ],
                 ),
-                # CHESS BOARD COLUMN
-                dbc.Col(width={"size": 6}, children=[graph, about_this]),
             ],
-        ),
+        )
     ],
 )
 
 
+def serve_layout():
+    # Evaluated on every page load: until the data is ready the sliders use
+    # placeholder bounds, and data_poll fills in the real ones.
+    ready = dataset.is_ready()
+    if ready:
+        min_elo, max_elo, max_moves = dataset.get_bounds()
+    else:
+        (min_elo, max_elo), max_moves = placeholder_elo, placeholder_moves
+
+    return dbc.Jumbotron(
+        style={"background-color": "#ebebeb"},  # ADD SETTINGS HERE
+        children=[
+            dcc.Interval(
+                id="data_poll", interval=data_poll_interval, disabled=ready
+            ),
+            # The view, as a shareable URL (see view_search).
+            dcc.Location(id="url", refresh=False),
+            # Identifies this page load, to drop its superseded requests.
+            dcc.Store(id="session_id", data=uuid.uuid4().hex),
+            dcc.Interval(
+                id="slider_tick",
+                interval=max(slider_throttle, 1),
+                disabled=slider_throttle <= 0,
+            ),
+            dcc.Store(id="slider_live"),
+            # The background job of the board, and the last one done.
+            dcc.Store(id="board_job"),
+            dcc.Store(id="job_done"),
+            dcc.Interval(id="job_poll", interval=job_poll_interval, disabled=True),
+            # Banner
+            # Main Layout
+            dbc.Row(  # ADD SETTINGS HERE
+                children=[
+                    # PARAMETER SETTINGS COLUMN
+                    dbc.Col(
+                        children=[
+                            banner,
+                            c_total_games,
+                            stacked_graph,
+                            dbc.Row(
+                                style={"margin-bottom": margin_bottom},
+                                children=[c_choose_side, c_select_piece],
+                            ),
+                            make_elo_slider(min_elo, max_elo),
+                            make_moves_slider(max_moves),
+                            *[make_rating_slider(*slider) for slider in rating_sliders],
+                            dropdown_menus,
+                            dropdown_eco,
+                            dropdown_material,
+                            date_range,
+                            dropdown_states,
+                        ]
+                    ),
+                    # CHESS BOARD COLUMN
+                    dbc.Col(
+                        width={"size": 6},
+                        children=[graph, export_links, drilldown_section, about_this],
+                    ),
+                ],
+            ),
+            mates_section,
+        ],
+    )
+
+
+app.layout = serve_layout
+
+
 @app.callback(
+    Output("elo_slider", "min"),
+    Output("elo_slider", "max"),
+    Output("elo_slider", "marks"),
+    Output("moves_slider", "max"),
+    Output("moves_slider", "marks"),
+    Output("data_poll", "disabled"),
+    Input("data_poll", "n_intervals"),
+    State("data_poll", "disabled"),
+)
+def update_slider_bounds(n_intervals, disabled):
+    # Replace the placeholder bounds once the dataset has been loaded. The
+    # ranges are then set by update_chessboard, from the URL.
+    if disabled or not dataset.is_ready():
+        return dash.no_update
+    min_elo, max_elo, max_moves = dataset.get_bounds()
+    return (
+        min_elo,
+        max_elo,
+        elo_marks(min_elo, max_elo),
+        max_moves,
+        moves_marks(max_moves),
+        True,
+    )
+
+
+# Coalesce slider drags: on every tick, send the dragged ranges to the server
+# only if they changed since the last tick. Runs in the browser.
+app.clientside_callback(
+    """
+    function(n_intervals, elo, moves, last) {
+        if (elo === undefined && moves === undefined) {
+            return window.dash_clientside.no_update;
+        }
+        var current = {elo: elo || null, moves: moves || null};
+        if (last && JSON.stringify(last) === JSON.stringify(current)) {
+            return window.dash_clientside.no_update;
+        }
+        return current;
+    }
+    """,
+    Output("slider_live", "data"),
+    Input("slider_tick", "n_intervals"),
+    State("elo_slider", "drag_value"),
+    State("moves_slider", "drag_value"),
+    State("slider_live", "data"),
+)
+
+
+# Latest request number per session. A request that is overtaken by a newer one
+# from the same session stops at the next stage boundary. This only happens
+# with threaded workers (gunicorn --threads), and within one worker.
+max_sessions = 10000
+latest_requests = collections.OrderedDict()
+latest_requests_lock = threading.Lock()
+
+
+def start_request(session_id):
+    with latest_requests_lock:
+        number = latest_requests.pop(session_id, 0) + 1
+        latest_requests[session_id] = number
+        if len(latest_requests) > max_sessions:
+            latest_requests.popitem(last=False)
+    return number
+
+
+def is_superseded(session_id, number):
+    return latest_requests.get(session_id, number) != number
+
+
+# Define the boards to count, as (columns, mask) pairs, and their labels. The
+# two boards of the comparison view are counted in one pass over the games.
+def board_selections(games, mask, filters, color, piece, compare):
+    columns = cp_dict[color, piece]
+    if compare == "colors":
+        boards = [(cp_dict["white_color", piece], mask), (cp_dict["black_color", piece], mask)]
+        return boards, ["WHITE " + piece.upper(), "BLACK " + piece.upper()]
+    if compare == "elo":
+        # Split the selected Elo range in the middle.
+        elo_min, elo_max = filters[:2]
+        middle = (elo_min + elo_max) // 2
+        upper = games["avg_Elo"].to_numpy() > middle
+        boards = [(columns, mask & ~upper), (columns, mask & upper)]
+        return boards, [f"ELO {elo_min} - {middle}", f"ELO {middle} - {elo_max}"]
+    if compare == "status":
+        # Both statuses are shown whatever the status filter is.
+        base = filter_mask(*filters[:4], ".*", *filters[5:])
+        status = games["status_code"].to_numpy()
+        boards = [
+            (columns, base & (status == dataset.STATUS_CODES["mate"])),
+            (columns, base & (status == dataset.STATUS_CODES["resign"])),
+        ]
+        return boards, ["CHECKMATE", "RESIGNATION"]
+    return [(columns, mask)], [""]
+
+
+# Define a cached function for the count vectors of the boards, one row of 64
+# per board. The heatmap modes are computed from these, not from the games.
+@functools.lru_cache(maxsize=filter_cache_size)
+def board_vectors(filters, color, piece, compare):
+    games = dataset.get_data()
+    query = table_query(filters) if compare in [None, "colors"] else None
+    # The tables only need the columns of the boards, not the selected games.
+    mask = filter_mask(*filters) if query is None else None
+    boards, labels = board_selections(games, mask, filters, color, piece, compare)
+    if query is not None and query[0] == "eco":
+        table = dataset.get_table("eco_squares")
+        counts = eco_board_counts(table, query[1], [columns for columns, _ in boards])
+    elif query is not None:
+        table = dataset.get_table("ratings")["squares"]
+        counts = rating_board_counts(table, *query[1], [columns for columns, _ in boards])
+    else:
+        counts = fused_board_counts(games, boards)
+    counts.setflags(write=False)
+    return counts, tuple(labels)
+
+
+@functools.lru_cache(maxsize=filter_cache_size)
+def view_totals(filters):
+    """Results and moves range of the games selected by filters, as
+    [white, black, draw, fewest moves, most moves]: from the tables when they
+    serve the filters (see table_query), else from filter_mask."""
+    query = table_query(filters)
+    if query is not None and query[0] == "eco":
+        totals = eco_totals(dataset.get_table("eco_totals"), query[1])
+    elif query is not None:
+        totals = rating_totals(dataset.get_table("ratings"), *query[1])
+    else:
+        games = dataset.get_data()
+        mask = filter_mask(*filters)
+        # Winner is encoded as 0 white, 1 black, 2 draw (see dataset.WINNER_CODES).
+        results = np.bincount(games["winner_code"].to_numpy()[mask], minlength=3)
+        moves = games["moves"].to_numpy()[mask]
+        span = [moves.min(), moves.max()] if len(moves) else [np.iinfo(np.int64).max, -1]
+        totals = np.concatenate([results, span]).astype(np.int64)
+    totals.setflags(write=False)
+    return totals
+
+
+def table_query(filters):
+    """How the precomputed tables serve filters without reading the games:
+    ("eco", code) when only the opening is filtered, ("ratings", bins) when
+    only the ratings of the sides are, on whole bins (see rating_bins), else
+    None."""
+    eco = filters[8]
+    if eco is not None and dataset.has_openings() and unfiltered(filters, keep=[8]):
+        code = eco_code(eco)
+        if code is not None:
+            return "eco", code
+    bins = rating_bins(*filters[10:12])
+    if bins is not None and unfiltered(filters, keep=[10, 11]):
+        return "ratings", bins
+    return None
+
+
+def unfiltered(filters, keep=()):
+    """Whether filters select every game, but for the filters at the indexes
+    keep of the tuple. Told from the tuple, without reading the games."""
+    min_elo, max_elo, min_moves, max_moves = data_ranges(dataset.version())
+    elo_min, elo_max, moves_min, moves_max = filters[:4]
+    if not (elo_min <= min_elo and elo_max >= max_elo):
+        return False
+    if not (moves_min <= min_moves and moves_max >= max_moves):
+        return False
+    others = [i for i in range(4, len(filters)) if i not in keep]
+    return all(filters[i] == (".*" if i < 8 else None) for i in others)
+
+
+@functools.lru_cache(maxsize=1)
+def data_ranges(version):
+    # Exact ranges of the Elo and moves of the games: NaN when a game has no
+    # average Elo, which no Elo range selects.
+    games = dataset.get_data()
+    elo, moves = games["avg_Elo"].to_numpy(), games["moves"].to_numpy()
+    return elo.min(), elo.max(), moves.min(), moves.max()
+
+
+def rating_bins(white_elo, black_elo):
+    """The (first, stop) bins of the white and black rating filters in the
+    prefix sums of dataset.rating_table, or None unless both are on whole bins
+    and one is set."""
+    if (white_elo is None and black_elo is None) or not dataset.has_ratings():
+        return None
+    (first, stop), _ = dataset.get_rating_bounds()
+    bins = []
+    for bounds in [white_elo, black_elo]:
+        bounds = bounds or (first, stop)
+        if any((value - first) % dataset.rating_bin for value in bounds):
+            return None
+        bins.append(
+            tuple(
+                min(max((value - first) // dataset.rating_bin, 0), (stop - first) // dataset.rating_bin)
+                for value in bounds
+            )
+        )
+    return bins
+
+
+# Filters selecting every game, for the baseline of the lift and difference heatmaps.
+all_games_filters = (
+    *placeholder_elo,
+    0,
+    placeholder_moves,
+    ".*",
+    ".*",
+    ".*",
+    ".*",
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+)
+
+
+def baseline_vectors(color, piece, compare):
+    # Counts of the same pieces over all games, one row per board.
+    if compare == "colors":
+        return board_vectors(all_games_filters, color, piece, compare)[0]
+    counts = board_vectors(all_games_filters, color, piece, None)[0]
+    return np.repeat(counts, 1 if compare is None else 2, axis=0)
+
+
+def scanned_rows(filters, compare):
+    # Rows scanned by a query, once per board, to tell the large ones.
+    if compare in [None, "colors"] and table_query(filters) is not None:
+        return 0
+    rows, span = filter_rows(*filters[8:10], *filters[-2:]), date_span(*filters[-2:])
+    return len(rows if gather_rows(rows, span) else span) * (1 if compare is None else 2)
+
+
+def result_key(filters, color, piece, compare, with_baseline):
+    # Key of a board_result in the store of the background jobs. Results
+    # saved with a mask rather than totals are not read.
+    return repr((dataset.version(), "totals", filters, color, piece, compare, with_baseline))
+
+
+def board_result(filters, color, piece, compare, with_baseline, stages=None):
+    """Totals (see view_totals), board counts and labels of a query, and the
+    baseline counts when asked. Run inline or as a background job, whose
+    result is saved. Stages are timed on the StageTimer of the calling
+    callback, if any."""
+    stages = stages or monitoring.StageTimer("board_result", enabled=False)
+    with jobs.span(0, 0.7):
+        totals = view_totals(filters)
+    stages.lap("filter")
+    with jobs.span(0.7, 0.9):
+        counts, labels = board_vectors(filters, color, piece, compare)
+    stages.lap("board_output")
+    result = {"totals": totals, "counts": counts, "labels": np.array(labels, dtype=str)}
+    if with_baseline:
+        with jobs.span(0.9, 1):
+            result["baseline"] = baseline_vectors(color, piece, compare)
+        stages.lap("baseline")
+    return result
+
+
+def board_figures(counts, baseline, heatmap, dimensions):
+    """Chessboard figures for the rows of counts. All boards share one scale.
+    The difference heatmap is a single board: the first row minus the second,
+    or minus the baseline when there is only one."""
+    max_size = heatmap_max_size * dimensions / board_dimensions
+
+    def figure(trace):
+        chessboard = getChessboardDict(dimensions)
+        chessboard["data"].append(trace)
+        return chessboard
+
+    if heatmap == "counts":
+        # In percent of the games of each board.
+        scale = np.round(shares(counts), 2).max()
+        return [
+            figure(getHeatmapDict(board, max_size=max_size, scale=scale)) for board in counts
+        ]
+    if heatmap == "difference":
+        values = difference(counts[0], counts[1] if len(counts) > 1 else baseline[0])
+        hovertext = [f"{value:+.2f} pts" for value in values]
+        trace = getMeasureHeatmapDict(values, hovertext, "Difference", max_size=max_size)
+        return [figure(trace)]
+    if heatmap == "log":
+        values, label = log_counts(counts), "# Games"
+        hovertext = counts.tolist()
+    else:
+        values, label = lift(counts, baseline), "Lift"
+        hovertext = [
+            [f"{v:.2f}x ({n} games)" for v, n in zip(row, board)]
+            for row, board in zip(values, counts.tolist())
+        ]
+    scale = values.max()
+    return [
+        figure(getMeasureHeatmapDict(v, text, label, max_size=max_size, scale=scale))
+        for v, text in zip(values, hovertext)
+    ]
+
+
+# Inputs of the board callbacks: the filters and view settings.
+board_inputs = [
+    Input("white_color", "n_clicks"),
+    Input("black_color", "n_clicks"),
+    Input("King", "n_clicks"),
+    Input("Queen", "n_clicks"),
+    Input("Rook", "n_clicks"),
+    Input("Bishop", "n_clicks"),
+    Input("Knight", "n_clicks"),
+    Input("elo_slider", "value"),
+    Input("st_all", "n_clicks"),
+    Input("st_draw", "n_clicks"),
+    Input("st_mate", "n_clicks"),
+    Input("st_resign", "n_clicks"),
+    Input("st_outoftime", "n_clicks"),
+    Input("wn_all", "n_clicks"),
+    Input("wn_white", "n_clicks"),
+    Input("wn_black", "n_clicks"),
+    Input("tc_all", "n_clicks"),
+    Input("tc_blitz", "n_clicks"),
+    Input("tc_bullet", "n_clicks"),
+    Input("tc_classic", "n_clicks"),
+    Input("tc_none", "n_clicks"),
+    Input("gt_all", "n_clicks"),
+    Input("gt_std", "n_clicks"),
+    Input("gt_tourney", "n_clicks"),
+    Input("cmp_off", "n_clicks"),
+    Input("cmp_colors", "n_clicks"),
+    Input("cmp_elo", "n_clicks"),
+    Input("cmp_status", "n_clicks"),
+    Input("hm_counts", "n_clicks"),
+    Input("hm_log", "n_clicks"),
+    Input("hm_lift", "n_clicks"),
+    Input("hm_diff", "n_clicks"),
+    Input("moves_slider", "value"),
+    Input("eco_dropdown", "value"),
+    Input("material_dropdown", "value"),
+    Input("white_elo_slider", "value"),
+    Input("black_elo_slider", "value"),
+    Input("elo_difference_slider", "value"),
+    Input("date_range", "start_date"),
+    Input("date_range", "end_date"),
+    Input("slider_live", "data"),
+]
+
+
+def board_filters(
+    elo_range,
+    move_range,
+    status,
+    winner,
+    time_control,
+    game_type,
+    eco,
+    material,
+    white_elo,
+    black_elo,
+    elo_difference,
+    start_date,
+    end_date,
+):
+    # The filter_mask arguments, from the callback inputs.
+    return (
+        int(elo_range[0]),
+        int(elo_range[1]),
+        int(move_range[0]),
+        int(move_range[-1]),
+        status,
+        winner,
+        time_control,
+        game_type,
+        eco or None,
+        material or None,
+        *rating_filters(white_elo, black_elo, elo_difference),
+        start_date[:10] if start_date else None,
+        end_date[:10] if end_date else None,
+    )
+
+
+def rating_filters(white_elo, black_elo, elo_difference):
+    """The rating ranges of the sliders, as filter_mask arguments: (first,
+    last) pairs, with last excluded, or None where a slider covers the whole
+    dataset."""
+    if not dataset.has_ratings():
+        bounds = [None] * 3
+    else:
+        (first, stop), max_difference = dataset.get_rating_bounds()
+        bounds = [(first, stop), (first, stop), (-max_difference, max_difference)]
+    filters = []
+    for value, full in zip([white_elo, black_elo, elo_difference], bounds):
+        if value is None or (full is not None and value[0] <= full[0] and value[1] >= full[1]):
+            filters.append(None)
+        else:
+            filters.append((int(value[0]), int(value[1])))
+    return filters
+
+
+def board_key(filters, color, piece, compare):
+    # Identifies the boards of a figure, to match approximate and exact boards
+    # and to list the games of a clicked square (see drill_down).
+    return repr((filters, color, piece, compare))
+
+
+def parse_board_key(key):
+    """The filters, color, piece and compare mode of a board_key. Keys come
+    back from the browser: raises ValueError unless every value is one the
+    filters can take."""
+    try:
+        filters, color, piece, compare = ast.literal_eval(key)
+        valid = (
+            len(filters) == len(all_games_filters)
+            and all(isinstance(value, int) for value in filters[:4])
+            and filters[4] in st_dict.values()
+            and filters[5] in wn_dict.values()
+            and filters[6] in tc_dict.values()
+            and filters[7] in gt_dict.values()
+            and all(value is None or isinstance(value, str) for value in filters[8:10])
+            and filters[9] in [None, *MATERIAL_FILTERS]
+            and all(
+                value is None or (len(value) == 2 and all(isinstance(v, int) for v in value))
+                for value in filters[10:13]
+            )
+            and all(value is None or isinstance(value, str) for value in filters[13:])
+            and (color, piece) in cp_dict
+            and compare in cmp_dict.values()
+        )
+    except (ValueError, SyntaxError, TypeError):
+        valid = False
+    if not valid:
+        raise ValueError(f"Invalid board key: {key!r}")
+    return filters, color, piece, compare
+
+
+# Fields of views and API queries given as "first,last" ranges.
+rating_fields = ["white_elo", "black_elo", "elo_difference"]
+range_fields = ["elo", "moves", *rating_fields, "dates"]
+
+
+def view_search(filters, color, piece, compare, heatmap):
+    """The URL query string of a view. Only the fields that differ from the
+    default view are given, in a fixed order, and ranges covering the whole
+    dataset are left out: equal views get equal strings."""
+    min_elo, max_elo, min_moves, max_moves = view_bounds(dataset.version())
+    elo = (filters[0] if filters[0] > min_elo else min_elo, min(filters[1], max_elo))
+    moves = (filters[2] if filters[2] > min_moves else 0, min(filters[3], max_moves))
+    fields = [
+        ("color", color.split("_")[0], "white"),
+        ("piece", piece, "King"),
+        ("elo", f"{elo[0]},{elo[1]}", f"{min_elo},{max_elo}"),
+        ("moves", f"{moves[0]},{moves[1]}", f"0,{max_moves}"),
+        ("status", filters[4], ".*"),
+        ("winner", filters[5], ".*"),
+        ("time_control", filters[6], ".*"),
+        ("game_type", filters[7], ".*"),
+        ("eco", filters[8], None),
+        ("material", filters[9], None),
+        *[
+            (name, None if value is None else f"{value[0]},{value[1]}", None)
+            for name, value in zip(rating_fields, filters[10:13])
+        ],
+        ("dates", ",".join(date or "" for date in filters[-2:]), ","),
+        ("compare", compare, None),
+        ("heatmap", heatmap, "counts"),
+    ]
+    pairs = [(name, value) for name, value, default in fields if value != default]
+    return "?" + urllib.parse.urlencode(pairs, safe=",") if pairs else ""
+
+
+def parse_view(search):
+    """The filters, color, piece, compare mode and heatmap of a view_search
+    string. Raises ValueError for unknown fields or values."""
+    spec = dict(urllib.parse.parse_qsl(search.lstrip("?")))
+    compare = spec.pop("compare", None)
+    heatmap = spec.pop("heatmap", "counts")
+    if compare not in cmp_dict.values() or heatmap not in hm_dict.values():
+        raise ValueError(f"Unknown compare mode or heatmap in {search!r}")
+    for name in range_fields:
+        if name in spec:
+            spec[name] = [value or None for value in spec[name].split(",")]
+    min_elo, max_elo, _, max_moves = view_bounds(dataset.version())
+    spec.setdefault("elo", [min_elo, max_elo])
+    spec.setdefault("moves", [0, max_moves])
+    _, (filters, color, piece) = api_query(spec)
+    return filters, color, piece, compare, heatmap
+
+
+@functools.lru_cache(maxsize=1)
+def view_bounds(version):
+    # The ranges of the sliders covering the whole dataset, as in board_filters.
+    games = dataset.get_data()
+    min_elo, max_elo, max_moves = dataset.get_bounds()
+    return int(min_elo), int(max_elo), int(games["moves"].min()), int(max_moves)
+
+
+view_cache = collections.OrderedDict()
+view_cache_lock = threading.Lock()
+
+
+def cached_view(search):
+    """The render_view outputs of a view_search string, if cached."""
+    key = (dataset.version(), search)
+    with view_cache_lock:
+        outputs = view_cache.get(key)
+        if outputs is not None:
+            view_cache.move_to_end(key)
+        return outputs
+
+
+def cache_view(search, outputs):
+    with view_cache_lock:
+        view_cache[dataset.version(), search] = outputs
+        if len(view_cache) > view_cache_size:
+            view_cache.popitem(last=False)
+
+
+# Outputs of update_chessboard. The last one starts the polling of background jobs.
+board_outputs = [
     Output("chessboard", "figure"),
+    Output("chessboard_compare", "figure"),
+    Output("compare_col", "style"),
+    Output("chessboard_label", "children"),
+    Output("chessboard_compare_label", "children"),
     Output("stackedbar", "figure"),
     Output("game_count", "children"),
     Output("white_wins", "children"),
@@ -545,33 +1744,27 @@ app.layout = dbc.Jumbotron(
     Output("g_winner", "children"),
     Output("g_time_control", "children"),
     Output("g_game_type", "children"),
-    [
-        Input("white_color", "n_clicks"),
-        Input("black_color", "n_clicks"),
-        Input("King", "n_clicks"),
-        Input("Queen", "n_clicks"),
-        Input("Rook", "n_clicks"),
-        Input("Bishop", "n_clicks"),
-        Input("Knight", "n_clicks"),
-        Input("elo_slider", "value"),
-        Input("st_all", "n_clicks"),
-        Input("st_draw", "n_clicks"),
-        Input("st_mate", "n_clicks"),
-        Input("st_resign", "n_clicks"),
-        Input("st_outoftime", "n_clicks"),
-        Input("wn_all", "n_clicks"),
-        Input("wn_white", "n_clicks"),
-        Input("wn_black", "n_clicks"),
-        Input("tc_all", "n_clicks"),
-        Input("tc_blitz", "n_clicks"),
-        Input("tc_bullet", "n_clicks"),
-        Input("tc_classic", "n_clicks"),
-        Input("tc_none", "n_clicks"),
-        Input("gt_all", "n_clicks"),
-        Input("gt_std", "n_clicks"),
-        Input("gt_tourney", "n_clicks"),
-        Input("moves_slider", "value"),
-    ],
+    Output("g_compare", "children"),
+    Output("g_heatmap", "children"),
+    # Set when the view comes from the URL, which is kept up to date.
+    Output("elo_slider", "value"),
+    Output("eco_dropdown", "value"),
+    Output("material_dropdown", "value"),
+    Output("white_elo_slider", "value"),
+    Output("black_elo_slider", "value"),
+    Output("elo_difference_slider", "value"),
+    Output("date_range", "start_date"),
+    Output("date_range", "end_date"),
+    Output("url", "search"),
+    Output("board_job", "data"),
+]
+
+
+@app.callback(
+    board_outputs,
+    board_inputs
+    + [Input("url", "search"), Input("data_poll", "disabled"), Input("job_done", "data")],
+    State("session_id", "data"),
 )
 def update_chessboard(
     white_color,
@@ -598,106 +1791,200 @@ def update_chessboard(
     gt_all,
     gt_std,
     gt_tourney,
+    cmp_off,
+    cmp_colors,
+    cmp_elo,
+    cmp_status,
+    hm_counts,
+    hm_log,
+    hm_lift,
+    hm_diff,
     move_range,
+    eco,
+    material,
+    white_elo,
+    black_elo,
+    elo_difference,
+    start_date,
+    end_date,
+    slider_live,
+    search,
+    data_loaded,
+    job_done,
+    session_id,
 ):
+    if not dataset.is_ready():
+        return dash.no_update
+    request_number = start_request(session_id)
+    stages = monitoring.StageTimer("update_chessboard")
+
     # Trigger button here, for when a button is pressed.
     trigger_button = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
 
-    global g_status
-    global g_winner
-    global g_time_control
-    global g_game_type
-
-    if trigger_button in st_dict.keys():
-        g_status = st_dict[trigger_button]
+    # While a slider is dragged, use the coalesced ranges it sent.
+    if trigger_button == "slider_live":
+        elo_range = slider_live["elo"] or elo_range
+        move_range = slider_live["moves"] or move_range
 
-    elif trigger_button in wn_dict.keys():
-        g_winner = wn_dict[trigger_button]
-
-    elif trigger_button in tc_dict.keys():
-        g_time_control = tc_dict[trigger_button]
-
-    elif trigger_button in gt_dict.keys():
-        g_game_type = gt_dict[trigger_button]
+    # Each page keeps its view in its URL: the button pressed changes that view.
+    # Opening the page (or the data becoming ready) and the back and forward
+    # buttons show the view of the URL.
+    from_url = trigger_button in ["", "url", "data_poll"]
+    view = url_view(search)
+    state = filter_state(trigger_button, view)
+    color, piece, compare, heatmap = (state[k] for k in ["color", "piece", "compare", "heatmap"])
 
     # Filters go here.
-    dff = df_original[
-        (df_original["avg_Elo"] >= int(elo_range[0]))
-        & (df_original["avg_Elo"] <= int(elo_range[1]))
-        & (df_original["moves"] >= int(move_range[0]))
-        & (df_original["moves"] <= int(move_range[-1]))
-        & (df_original["victory_status"].str.contains(g_status))
-        & (df_original["Winner"].str.contains(g_winner))
-        & (df_original["Event"].str.contains(g_time_control))
-        & (df_original["Event"].str.contains(g_game_type))
-    ]
-    if dff.shape[0] == 0:
-        return dash.no_update
-    min_moves_, max_moves_ = dff["moves"].min(), dff["moves"].max()
-    print(f"{min_moves_ = }, {max_moves_ = }")
-    value_ = [min_moves_, max_moves_]
-
-    # Before further manipulation, get the number of games from the filtered dataframe.
-    game_count = dff.shape[0]
-    game_results = dff.Winner.value_counts().to_dict()
-    game_results_norm = np.round(
-        dff.Winner.str.upper().value_counts(normalize=True), 4
-    ).to_dict()
-
-    if "white" in game_results.keys():
-        white_wins = game_results["white"]
-    else:
-        white_wins = 0
-    if "black" in game_results.keys():
-        black_wins = game_results["black"]
-    else:
-        black_wins = 0
-    if "draw" in game_results.keys():
-        draw = game_results["draw"]
+    if from_url:
+        filters = view[0]
     else:
-        draw = 0
-    print(game_results_norm)
-    stackedbar = getStackedBar(game_results_norm)
-
-    # Then retrieve the column of interest.
-    global g_color
-    global g_piece
-
-    if trigger_button in ["white_color", "black_color"]:
-        g_color = trigger_button
-    if trigger_button in pieces_list:
-        g_piece = trigger_button
-
-    df = board_output(dff, cp_dict[g_color, g_piece])
-
-    # Additionally:
-    if g_status == "draw":
-        is_open = False
-    else:
-        is_open = True
-    # Additionaly pt.2:
-    if g_color == "white_color":
-        wc_act, bc_act = True, False
-    else:
-        wc_act, bc_act = False, True
+        filters = board_filters(
+            elo_range,
+            move_range,
+            state["status"],
+            state["winner"],
+            state["time_control"],
+            state["game_type"],
+            eco,
+            material,
+            white_elo,
+            black_elo,
+            elo_difference,
+            start_date,
+            end_date,
+        )
+    # Equal views share one URL, which is also the key of their cached figures.
+    search = view_search(filters, color, piece, compare, heatmap)
+    try:
+        filters = parse_view(search)[0]
+    except ValueError as e:
+        # E.g. an opening or a rating range the dataset has no column for.
+        logger.warning("Ignoring the view %r: %s", search, e)
+        return dash.no_update
+    outputs = cached_view(search)
+
+    # Large queries run as background jobs. This callback runs again when they
+    # are done (job_done), and reads their saved result.
+    with_baseline = heatmap in ["lift", "difference"]
+    key = result_key(filters, color, piece, compare, with_baseline)
+    result = None
+    if outputs is None:
+        result = jobs.load(key)
+        if result is None and scanned_rows(filters, compare) > job_min_rows:
+            job = jobs.submit(
+                session_id, key, board_result, filters, color, piece, compare, with_baseline
+            )
+            # The URL already shows the new view, which the run after the job reads.
+            return [dash.no_update] * (len(board_outputs) - 2) + [search, {"id": job.id}]
+    jobs.cancel(session_id)
+    if is_superseded(session_id, request_number):
+        return dash.no_update
+    if outputs is None:
+        if result is None:
+            result = board_result(filters, color, piece, compare, with_baseline, stages)
+        # A newer request may have arrived while the board was counted.
+        if is_superseded(session_id, request_number):
+            return dash.no_update
+        outputs = render_view(filters, color, piece, compare, heatmap, result, stages)
+        cache_view(search, outputs)
+    if not outputs:
+        return dash.no_update
 
-    # Additionaly pt3:
-    k_act, q_act, r_act, b_act, n_act = [x == g_piece for x in pieces_list]
+    # Only move the slider when its range changes, and never while it is dragged.
+    moves_value = outputs["moves"]
+    if moves_value == list(move_range) or trigger_button == "slider_live":
+        moves_value = dash.no_update
+    # The other filters only change when the view comes from the URL.
+    elo_value, eco_value, material_value = list(filters[:2]), filters[8], filters[9]
+    ratings = rating_values(filters[10:13])
+    dates = list(filters[-2:])
+    if not from_url:
+        elo_value, eco_value, material_value = [dash.no_update] * 3
+        ratings, dates = [dash.no_update] * 3, [dash.no_update] * 2
+    stages.done(
+        games=outputs["games"],
+        color=color,
+        piece=piece,
+        status=filters[4],
+        winner=filters[5],
+        time_control=filters[6],
+        game_type=filters[7],
+        compare=compare,
+        heatmap=heatmap,
+        eco=filters[8],
+        material=filters[9],
+        ratings=filters[10:13],
+        dates=filters[-2:],
+    )
 
-    # Transform it for the heatmap.
-    df = (
-        df.stack()
-        .reset_index()
-        .rename(columns={"level_0": "rows", "level_1": "cols", 0: "freq"})
+    return (
+        outputs["chessboard"],
+        outputs["chessboard_compare"],
+        outputs["compare_style"],
+        *outputs["labels"],
+        outputs["stackedbar"],
+        outputs["games"],
+        *outputs["results"],
+        outputs["is_open"],
+        *outputs["active"],
+        moves_value,
+        *outputs["menus"],
+        elo_value,
+        eco_value,
+        material_value,
+        *ratings,
+        *dates,
+        search,
+        None,
     )
 
-    df["rows"] = df["rows"].replace({i: list(range(8))[::-1][i] for i in range(8)})
-    chessboard = getChessboard(800)
-    getBoard(chessboard)
-    chessboard.add_trace(getHeatmap(dataframe=df))
 
-    print(
-        f"{g_color = }, {g_game_type = }, {g_piece = }, {g_status = }, {g_time_control = }, {g_winner = }"
+def rating_values(filters):
+    # Values of the rating sliders for the rating filters, as rating_filters reads them.
+    if not dataset.has_ratings():
+        return [dash.no_update] * 3
+    (first, stop), max_difference = dataset.get_rating_bounds()
+    full = [[first, stop], [first, stop], [-max_difference, max_difference]]
+    return [list(value or default) for value, default in zip(filters, full)]
+
+
+def render_view(filters, color, piece, compare, heatmap, result, stages=None):
+    """Figures and labels of a view, from its board_result. Empty when no
+    game is selected. Cached under the view's URL (see cached_view)."""
+    stages = stages or monitoring.StageTimer("render_view", enabled=False)
+    white_wins, black_wins, draw, fewest_moves, most_moves = result["totals"].tolist()
+    n_games = white_wins + black_wins + draw
+    if n_games == 0:
+        return {}
+    status, winner, time_control, game_type = filters[4:8]
+    stages.lap("value_counts")
+
+    # Build the figures as plain dicts, skipping plotly's validation.
+    counts, labels = result["counts"], result["labels"].tolist()
+    baseline = result["baseline"] if heatmap in ["lift", "difference"] else None
+    if heatmap == "difference":
+        labels = [" - ".join(labels) if compare else "SELECTION - ALL GAMES", ""]
+    single = compare is None or heatmap == "difference"
+    figures = board_figures(
+        counts, baseline, heatmap, board_dimensions if single else compare_dimensions
+    )
+    key = board_key(filters, color, piece, compare)
+    for figure in figures:
+        figure["layout"] = dict(figure["layout"], meta=key)
+    labels = list(labels) + [""] * (2 - len(labels))
+    stages.lap("chessboard")
+    stackedbar = getStackedBarDict(white_wins, black_wins, draw)
+    stages.lap("stackedbar")
+
+    logger.debug(
+        "%s %s, status=%s winner=%s time_control=%s game_type=%s, %d games",
+        color,
+        piece,
+        status,
+        winner,
+        time_control,
+        game_type,
+        n_games,
     )
 
     g_status_ = {
@@ -706,13 +1993,13 @@ def update_chessboard(
         "mate": "Status: checkmate",
         "resign": "Status: resignation",
         "outoftime": "Status: time forfeit",
-    }[g_status]
+    }[status]
 
     g_winner_ = {
         ".*": "winner: All",
         "white": "winner: white",
         "black": "winner: black",
-    }[g_winner]
+    }[winner]
 
     g_time_control_ = {
         ".*": "time control: all",
@@ -720,35 +2007,735 @@ def update_chessboard(
         "Blitz": "time control: Blitz",
         "Classical": "time control: Classical",
         "Correspondence": "time control: No Time Control",
-    }[g_time_control]
+    }[time_control]
 
     g_game_type_ = {
         ".*": "game type: all",
         "game": "game type: standard",
         "tournament": "game type: tournament",
-    }[g_game_type]
+    }[game_type]
+
+    g_compare_ = {
+        None: "compare: off",
+        "colors": "compare: white vs black",
+        "elo": "compare: elo",
+        "status": "compare: checkmate vs resignation",
+    }[compare]
+
+    g_heatmap_ = {
+        "counts": "heatmap: games",
+        "log": "heatmap: games, log scale",
+        "lift": "heatmap: lift",
+        "difference": "heatmap: difference",
+    }[heatmap]
+
+    return {
+        "chessboard": figures[0],
+        "chessboard_compare": dash.no_update if single else figures[1],
+        "compare_style": {"display": "none"} if single else {},
+        "labels": labels[:2],
+        "stackedbar": stackedbar,
+        "games": n_games,
+        "results": [white_wins, black_wins, draw],
+        # The winner menu is closed for draws.
+        "is_open": status != "draw",
+        "active": [color == "white_color", color == "black_color"]
+        + [x == piece for x in pieces_list],
+        "moves": [fewest_moves, most_moves],
+        "menus": [
+            text.upper()
+            for text in [
+                g_status_,
+                g_winner_,
+                g_time_control_,
+                g_game_type_,
+                g_compare_,
+                g_heatmap_,
+            ]
+        ],
+    }
+
 
+@app.callback(
+    Output("job_poll", "disabled"),
+    Output("job_status", "style"),
+    Output("job_progress", "value"),
+    Output("job_progress", "children"),
+    Output("job_done", "data"),
+    Input("job_poll", "n_intervals"),
+    Input("board_job", "data"),
+)
+def poll_board_job(n_intervals, board_job):
+    # Show the progress of the background job, and hand it to update_chessboard when done.
+    job = jobs.get(board_job["id"]) if board_job else None
+    hidden = {"display": "none"}
+    if job is None or job.state == "cancelled":
+        return True, hidden, 0, "", dash.no_update
+    if job.state == "done":
+        return True, hidden, 100, "", job.id
+    if job.state == "failed":
+        return True, {}, 100, "FAILED", dash.no_update
+    percent = round(job.progress * 100)
+    return False, {}, percent, f"{percent}%", dash.no_update
+
+
+def url_view(search):
+    """The parse_view of a page's URL, or the default view if it is not valid."""
+    try:
+        return parse_view(search or "")
+    except ValueError as e:
+        logger.warning("Ignoring the view of the URL %r: %s", search, e)
+        return parse_view("")
+
+
+def filter_state(trigger_button, view):
+    """The menu and view settings of a parse_view view after trigger_button.
+    The view is the page's own, from its URL, so sessions do not share them."""
+    filters, color, piece, compare, heatmap = view
+    state = {
+        "status": filters[4],
+        "winner": filters[5],
+        "time_control": filters[6],
+        "game_type": filters[7],
+        "compare": compare,
+        "heatmap": heatmap,
+        "color": color,
+        "piece": piece,
+    }
+    for key, options in [
+        ("status", st_dict),
+        ("winner", wn_dict),
+        ("time_control", tc_dict),
+        ("game_type", gt_dict),
+        ("compare", cmp_dict),
+        ("heatmap", hm_dict),
+    ]:
+        if trigger_button in options:
+            state[key] = options[trigger_button]
+    if trigger_button in ["white_color", "black_color"]:
+        state["color"] = trigger_button
+    if trigger_button in pieces_list:
+        state["piece"] = trigger_button
+    return state
+
+
+def approximate_board(filters, color, piece):
+    """Estimated counts of a board, and the estimate and standard error of its
+    number of games, from the stratified sample (see dataset.build_tables)."""
+    sample = dataset.get_table("sample")
+    games = sample["games"]
+    selected = select_games(games, *filters[:13])
+    date_start, date_end = filters[-2:]
+    if date_start is not None:
+        selected &= games["date_code"].to_numpy() >= dataset.date_code(date_start)
+    if date_end is not None:
+        selected &= games["date_code"].to_numpy() <= dataset.date_code(date_end)
+    estimate, error = estimate_count(sample, selected)
+    counts = weighted_board_counts(games, selected, cp_dict[color, piece], sample["weights"])
+    return counts, estimate, error
+
+
+@app.callback(
+    Output("chessboard_approx", "figure"),
+    Output("approx_indicator", "children"),
+    board_inputs,
+    State("url", "search"),
+)
+def approximate_chessboard(*values):
+    # On large datasets, answer from the sample while update_chessboard
+    # computes the exact board. Only single boards of counts are approximated.
+    if not dataset.is_progressive():
+        return dash.no_update
+    stages = monitoring.StageTimer("approximate_chessboard")
+    inputs = dash.callback_context.inputs
+    trigger_button = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+    elo_range, move_range = inputs["elo_slider.value"], inputs["moves_slider.value"]
+    if trigger_button == "slider_live":
+        slider_live = inputs["slider_live.data"]
+        elo_range = slider_live["elo"] or elo_range
+        move_range = slider_live["moves"] or move_range
+    state = filter_state(trigger_button, url_view(dash.callback_context.states["url.search"]))
+    if state["compare"] is not None or state["heatmap"] != "counts":
+        return dash.no_update
+
+    filters = board_filters(
+        elo_range,
+        move_range,
+        state["status"],
+        state["winner"],
+        state["time_control"],
+        state["game_type"],
+        inputs["eco_dropdown.value"],
+        inputs["material_dropdown.value"],
+        inputs["white_elo_slider.value"],
+        inputs["black_elo_slider.value"],
+        inputs["elo_difference_slider.value"],
+        inputs["date_range.start_date"],
+        inputs["date_range.end_date"],
+    )
+    # Canonical, as the filters of the exact board, so that their meta match.
+    search = view_search(filters, state["color"], state["piece"], state["compare"], state["heatmap"])
+    try:
+        filters = parse_view(search)[0]
+    except ValueError:
+        return dash.no_update
+    counts, estimate, error = approximate_board(filters, state["color"], state["piece"])
+    stages.lap("sample")
+    if estimate == 0:
+        return dash.no_update
+    chessboard = board_figures(counts[np.newaxis], None, "counts", board_dimensions)[0]
+    chessboard["layout"] = dict(
+        chessboard["layout"],
+        meta=board_key(filters, state["color"], state["piece"], state["compare"]),
+    )
+    stages.done(games=round(estimate))
+    indicator = (
+        f"Approximate: {estimate:,.0f} \u00b1 {1.96 * error:,.0f} games (95%), "
+        f"from a sample of {len(dataset.get_table('sample')['games']):,}. Loading the exact board..."
+    )
+    return chessboard, indicator.upper()
+
+
+# Show the approximate board until the exact board with the same filters
+# arrives. Runs in the browser.
+app.clientside_callback(
+    """
+    function(approx, exact) {
+        var hidden = {display: "none"};
+        var triggered = window.dash_clientside.callback_context.triggered.map(
+            function(t) { return t.prop_id; }
+        );
+        if (!approx || triggered.indexOf("chessboard_approx.figure") < 0 ||
+                (exact && exact.layout.meta === approx.layout.meta)) {
+            return [hidden, hidden];
+        }
+        return [
+            {position: "absolute", top: 0, left: 0, right: 0},
+            {"text-align": "center"}
+        ];
+    }
+    """,
+    Output("approx_overlay", "style"),
+    Output("approx_indicator", "style"),
+    Input("chessboard_approx", "figure"),
+    Input("chessboard", "figure"),
+)
+
+
+@app.callback(
+    Output("eco_dropdown", "options"),
+    Output("eco_dropdown", "disabled"),
+    Output("eco_dropdown", "placeholder"),
+    Input("eco_dropdown", "search_value"),
+    Input("data_poll", "disabled"),
+    Input("eco_dropdown", "value"),
+)
+def search_openings(search_value, data_ready, value):
+    # Only the matching openings are sent, at most eco_option_limit of them.
+    if not dataset.is_ready():
+        return dash.no_update
+    if not dataset.has_openings():
+        return [], True, str("No openings in this dataset").upper()
+    search = (search_value or "").lower()
+    options = dataset.get_table("eco_options")
+    matches = [option for option in options if search in option["label"].lower()]
+    matches = matches[:eco_option_limit]
+    # Keep the selected opening, so that the dropdown can still show it.
+    if value and all(option["value"] != value for option in matches):
+        matches += [option for option in options if option["value"] == value]
+    return matches, False, dash.no_update
+
+
+@app.callback(
+    Output("date_range", "min_date_allowed"),
+    Output("date_range", "max_date_allowed"),
+    Output("date_range", "initial_visible_month"),
+    Output("date_range", "disabled"),
+    Input("data_poll", "disabled"),
+)
+def update_date_bounds(data_ready):
+    # Datasets without UTCDate keep the date filter disabled.
+    if not dataset.has_dates():
+        return dash.no_update
+    first, last = dataset.get_date_bounds()
+    return first, last, last, False
+
+
+@app.callback(
+    [
+        Output(slider_id, prop)
+        for slider_id, _, _ in rating_sliders
+        for prop in ["min", "max", "marks", "disabled"]
+    ],
+    Input("data_poll", "disabled"),
+)
+def update_rating_bounds(data_ready):
+    # Datasets without ratings of each side keep these sliders disabled.
+    if not dataset.has_ratings():
+        return dash.no_update
+    (first, stop), max_difference = dataset.get_rating_bounds()
+    # About ten marks per slider, on multiples of the steps.
+    elo_step = -(-(stop - first) // 10 // dataset.rating_bin) * dataset.rating_bin
+    difference_step = -(-max_difference // 5 // dataset.difference_step) * dataset.difference_step
+    return [
+        first,
+        stop,
+        rating_marks(first, stop, elo_step),
+        False,
+        first,
+        stop,
+        rating_marks(first, stop, elo_step),
+        False,
+        -max_difference,
+        max_difference,
+        rating_marks(-max_difference, max_difference, difference_step),
+        False,
+    ]
+
+
+@app.callback(
+    Output("material_dropdown", "disabled"),
+    Input("data_poll", "disabled"),
+)
+def enable_material(data_ready):
+    # Datasets without endFEN keep the material filter disabled.
+    if not dataset.has_material():
+        return dash.no_update
+    return False
+
+
+@app.callback(
+    Output("mates_collapse", "is_open"),
+    Input("mates_button", "n_clicks"),
+    State("mates_collapse", "is_open"),
+)
+def toggle_mates(n_clicks, is_open):
+    if not n_clicks:
+        return dash.no_update
+    return not is_open
+
+
+@app.callback(
+    [Output(f"mates_{piece}", "figure") for piece in MATING_PIECES]
+    + [Output(f"mates_label_{piece}", "children") for piece in MATING_PIECES],
+    Input("mates_collapse", "is_open"),
+    Input("mates_winner", "value"),
+)
+def update_mates(is_open, winner):
+    if not is_open or not dataset.is_ready():
+        return dash.no_update
+    # One lookup in the precomputed table: no filtering of the games here.
+    counts = dataset.get_table("mate_squares")[:, mates_winner_dict[winner]].sum(axis=1)
+    figures = board_figures(counts, None, "counts", mates_dimensions)
+    labels = [
+        f"{piece.upper()}: {total} MATES"
+        for piece, total in zip(MATING_PIECES, counts.sum(axis=1).tolist())
+    ]
+    return figures + labels
+
+
+def square_rows(filters, color, piece, compare, board, square):
+    """Rows of the games of a board with the piece on square, and the label of
+    the board. Looked up in the inverted index, then filtered by the mask."""
+    games = dataset.get_data()
+    boards, labels = board_selections(
+        games, filter_mask(*filters), filters, color, piece, compare
+    )
+    columns, mask = boards[min(board, len(boards) - 1)]
+    rows = square_games(dataset.get_table("square_index"), columns, square, mask)
+    return rows, labels[min(board, len(labels) - 1)]
+
+
+@app.callback(
+    Output("drilldown", "data"),
+    Output("drilldown_section", "style"),
+    Output("drilldown_label", "children"),
+    Output("drilldown_table", "children"),
+    Output("drilldown_page", "children"),
+    Output("drilldown_prev", "disabled"),
+    Output("drilldown_next", "disabled"),
+    Input("chessboard", "clickData"),
+    Input("chessboard_compare", "clickData"),
+    Input("drilldown_prev", "n_clicks"),
+    Input("drilldown_next", "n_clicks"),
+    Input("chessboard", "figure"),
+    State("drilldown", "data"),
+)
+def drill_down(click, compare_click, prev_clicks, next_clicks, chessboard, drilldown):
+    # List the games where the piece of the board ended on the clicked square.
+    trigger = dash.callback_context.triggered[0]["prop_id"]
+    if trigger in ["chessboard.clickData", "chessboard_compare.clickData"]:
+        point = (click if trigger == "chessboard.clickData" else compare_click)["points"][0]
+        # Heatmap y is 0 on rank 1, square codes start at A8 (see chessboard.py).
+        square = (7 - int(point["y"])) * 8 + int(point["x"])
+        board = int(trigger == "chessboard_compare.clickData")
+        drilldown = {"board": board, "square": square, "page": 0}
+    elif drilldown is None:
+        return dash.no_update
+    elif trigger == "drilldown_prev.n_clicks":
+        drilldown = dict(drilldown, page=max(drilldown["page"] - 1, 0))
+    elif trigger == "drilldown_next.n_clicks":
+        drilldown = dict(drilldown, page=drilldown["page"] + 1)
+    else:
+        # New filters: the same square, from the first page.
+        drilldown = dict(drilldown, page=0)
+    meta = (chessboard or {}).get("layout", {}).get("meta")
+    if meta is None or not dataset.is_ready():
+        return dash.no_update
+
+    filters, color, piece, compare = parse_board_key(meta)
+    rows, label = square_rows(
+        filters, color, piece, compare, drilldown["board"], drilldown["square"]
+    )
+    pages = max((len(rows) - 1) // drilldown_page_size + 1, 1)
+    page = min(drilldown["page"], pages - 1)
+    drilldown["page"] = page
+    games = dataset.get_data()
+    columns = [column for column in drilldown_columns if column in games]
+    table = games.iloc[rows[page * drilldown_page_size : (page + 1) * drilldown_page_size]]
+    table = table[columns].rename(columns=drilldown_columns)
+
+    square = drilldown["square"]
+    name = "ABCDEFGH"[square % 8] + str(8 - square // 8)
+    color = "white" if color == "white_color" else "black"
+    if compare == "colors":
+        color = label.split()[0].lower()
+    prefix = f"{label}: " if label and compare not in [None, "colors"] else ""
+    text = f"{prefix}{len(rows)} games with the {color} {piece} on {name}"
     return (
-        chessboard,
-        stackedbar,
-        game_count,
-        white_wins,
-        black_wins,
-        draw,
-        is_open,
-        wc_act,
-        bc_act,
-        k_act,
-        q_act,
-        r_act,
-        b_act,
-        n_act,
-        value_,
-        g_status_.upper(),
-        g_winner_.upper(),
-        g_time_control_.upper(),
-        g_game_type_.upper(),
+        drilldown,
+        {"margin-top": "20px"},
+        text.upper(),
+        dbc.Table.from_dataframe(table, size="sm", striped=True),
+        f"PAGE {page + 1} OF {pages}",
+        page == 0,
+        page >= pages - 1,
+    )
+
+
+def condition_buckets(status, winner):
+    # Buckets of the co-occurrence table selected by the status and winner filters.
+    statuses = dataset.STATUS_CODES.values() if status == ".*" else [dataset.STATUS_CODES[status]]
+    winners = dataset.WINNER_CODES.values() if winner == ".*" else [dataset.WINNER_CODES[winner]]
+    return [s * len(dataset.WINNER_CODES) + w for s in statuses for w in winners]
+
+
+def square_condition_counts(filters, color, piece, compare, board, square, condition):
+    """Counts of the squares of the condition pieces in the games of a board
+    with the piece on square, and the columns of that piece."""
+    games = dataset.get_data()
+    boards, _ = board_selections(games, filter_mask(*filters), filters, color, piece, compare)
+    columns, mask = boards[min(board, len(boards) - 1)]
+    condition_columns = cp_dict[condition]
+    # When only status and winner are filtered, slice the precomputed table.
+    only_buckets = filter_mask(*filters[:4], ".*", ".*", *filters[6:]).all()
+    if compare in [None, "colors"] and only_buckets:
+        counts = conditional_counts(
+            dataset.get_table("cooccurrence"),
+            *[next(iter(piece_groups(cols))) for cols in [columns, condition_columns]],
+            square,
+            condition_buckets(*filters[4:6]),
+        )
+    else:
+        counts = conditional_board_counts(
+            games, dataset.get_table("square_index"), mask, columns, square, condition_columns
+        )
+    return counts, columns
+
+
+@app.callback(
+    Output("conditional_board", "figure"),
+    Output("conditional_label", "children"),
+    Input("drilldown", "data"),
+    Input("condition_piece", "value"),
+    State("chessboard", "figure"),
+)
+def conditional_board(drilldown, condition_piece, chessboard):
+    # The board of the chosen piece, given the square clicked for the board's piece.
+    meta = (chessboard or {}).get("layout", {}).get("meta")
+    if drilldown is None or meta is None or not dataset.is_ready():
+        return dash.no_update
+    filters, color, piece, compare = parse_board_key(meta)
+    condition = tuple(condition_piece.split())
+    square = drilldown["square"]
+    counts, columns = square_condition_counts(
+        filters, color, piece, compare, drilldown["board"], square, condition
+    )
+    figure = board_figures(counts[np.newaxis], None, "counts", mates_dimensions)[0]
+    name = "ABCDEFGH"[square % 8] + str(8 - square // 8)
+    side = "white" if columns[0].startswith("w") else "black"
+    text = (
+        f"Where is the {condition[0].split('_')[0]} {condition[1]} "
+        f"when the {side} {piece} is on {name}?"
+    )
+    return figure, text.upper()
+
+
+# Point the download links at the selection of the board. Runs in the browser.
+app.clientside_callback(
+    """
+    function(figure) {
+        var meta = figure && figure.layout && figure.layout.meta;
+        var hrefs = %s.map(function(path) {
+            return meta ? path + "?board=" + encodeURIComponent(meta) : "";
+        });
+        return [meta ? {} : {display: "none"}].concat(hrefs);
+    }
+    """
+    % json.dumps(
+        [f"/export/{kind}.{file_format}" for kind in ["games", "board"] for file_format in export_formats]
+    ),
+    Output("export_links", "style"),
+    *[
+        Output(f"export_{kind}_{file_format}", "href")
+        for kind in ["games", "board"]
+        for file_format in export_formats
+    ],
+    Input("chessboard", "figure"),
+)
+
+
+@server.route("/export/<kind>.<file_format>")
+def export_selection(kind, file_format):
+    # Download the games or the board counts of a board_key, passed as ?board=.
+    # Games are streamed a chunk at a time (see export.py).
+    if kind not in ["games", "board"] or file_format not in export_mimetypes:
+        return jsonify(error=f"Unknown export {kind}.{file_format}"), 404
+    if file_format not in export_formats:
+        return jsonify(error="Parquet exports need pyarrow"), 501
+    if not dataset.is_ready():
+        return jsonify(status=dataset.status()), 503
+    try:
+        filters, color, piece, compare = parse_board_key(request.args.get("board", ""))
+        mask = filter_mask(*filters)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    headers = {"Content-Disposition": f"attachment; filename=chess_{kind}.{file_format}"}
+    mimetype = export_mimetypes[file_format]
+    if kind == "board":
+        counts, labels = board_vectors(filters, color, piece, compare)
+        default = f"{color.split('_')[0]} {piece}".upper()
+        frame = export.board_frame(counts, [label or default for label in labels])
+        if file_format == "csv":
+            return Response(frame.to_csv(index=False), mimetype=mimetype, headers=headers)
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False)
+        return Response(buffer.getvalue(), mimetype=mimetype, headers=headers)
+
+    games, rows = dataset.get_data(), np.flatnonzero(mask)
+    if file_format == "csv":
+        chunks = export.games_csv(games, rows)
+    else:
+        chunks = export.games_parquet(games, rows)
+    return Response(chunks, mimetype=mimetype, headers=headers)
+
+
+# Defaults of the queries of the JSON API: every game, white king.
+api_defaults = {
+    "color": "white",
+    "piece": "King",
+    "elo": list(placeholder_elo),
+    "moves": [0, placeholder_moves],
+    "status": "all",
+    "winner": "all",
+    "time_control": "all",
+    "game_type": "all",
+    "eco": None,
+    "material": None,
+    "white_elo": None,
+    "black_elo": None,
+    "elo_difference": None,
+    "dates": [None, None],
+}
+# Values of the filters, as in the dropdown dicts, with "all" for every game.
+api_choices = {
+    "status": st_dict.values(),
+    "winner": wn_dict.values(),
+    "time_control": tc_dict.values(),
+    "game_type": gt_dict.values(),
+}
+
+
+def api_query(spec):
+    """The query of a JSON API spec, with the defaults filled in, and its
+    filter_mask arguments, color and piece. Raises ValueError for unknown
+    names or values."""
+    if not isinstance(spec, dict):
+        raise ValueError(f"A query must be an object, not {spec!r}")
+    unknown = set(spec) - set(api_defaults)
+    if unknown:
+        raise ValueError(f"Unknown query fields: {sorted(unknown)}")
+    query = dict(api_defaults, **spec)
+    patterns = {}
+    for name, values in api_choices.items():
+        patterns[name] = ".*" if query[name] == "all" else query[name]
+        if patterns[name] not in values:
+            raise ValueError(f"{name} must be one of {['all'] + list(values)[1:]}")
+    color = f"{query['color']}_color"
+    if (color, query["piece"]) not in cp_dict:
+        raise ValueError("color must be white or black, piece one of " + ", ".join(pieces_list))
+    try:
+        filters = board_filters(
+            [int(value) for value in query["elo"][:2]],
+            [int(value) for value in query["moves"][:2]],
+            patterns["status"],
+            patterns["winner"],
+            patterns["time_control"],
+            patterns["game_type"],
+            query["eco"] if query["eco"] is None else str(query["eco"]),
+            query["material"] if query["material"] is None else str(query["material"]),
+            *[None if query[name] is None else [int(v) for v in query[name][:2]] for name in rating_fields],
+            *[None if date is None else str(date) for date in query["dates"][:2]],
+        )
+    except (TypeError, ValueError, IndexError) as e:
+        raise ValueError(f"{', '.join(range_fields)} must be [first, last] pairs") from e
+    if filters[-2:] != (None, None) and not dataset.has_dates():
+        raise ValueError("This dataset has no dates to filter by")
+    for date in filters[-2:]:
+        # Malformed dates (e.g. from a URL) raise ValueError here, not in filter_mask.
+        try:
+            if date is not None:
+                dataset.date_code(date)
+        except ValueError as e:
+            raise ValueError(f"dates must be YYYY-MM-DD, not {date!r}") from e
+    if filters[8] is not None and (
+        not dataset.has_openings() or filters[8] not in dataset.get_data()["ECO"].cat.categories
+    ):
+        raise ValueError(f"Unknown opening {filters[8]!r}")
+    if filters[9] is not None and (not dataset.has_material() or filters[9] not in MATERIAL_FILTERS):
+        raise ValueError(f"material must be one of {list(MATERIAL_FILTERS)}")
+    if filters[10:13] != (None, None, None) and not dataset.has_ratings():
+        raise ValueError("This dataset has no ratings of each side to filter by")
+    query.update(
+        elo=list(filters[:2]),
+        moves=list(filters[2:4]),
+        eco=filters[8],
+        material=filters[9],
+        **{name: value and list(value) for name, value in zip(rating_fields, filters[10:13])},
+        dates=list(filters[-2:]),
+    )
+    return query, (filters, color, query["piece"])
+
+
+@server.route("/api/heatmaps", methods=["GET", "POST"])
+def api_heatmaps():
+    """Board counts and results of filtered games, as JSON.
+
+    GET takes one query as parameters (the ranges of range_fields as "first,last"),
+    POST a batch as {"queries": [...]}. All queries of a request are counted
+    in a single pass over the games. Responses carry an ETag of the dataset
+    version and the queries: a request with a matching If-None-Match gets a
+    304 without counting anything.
+    """
+    if not dataset.is_ready():
+        return jsonify(status=dataset.status()), 503
+    try:
+        if request.method == "POST":
+            body = request.get_json(silent=True)
+            specs = body.get("queries") if isinstance(body, dict) else None
+            if not isinstance(specs, list) or not 0 < len(specs) <= api_max_queries:
+                raise ValueError(f"Expected {{\"queries\": [...]}} with 1 to {api_max_queries} queries")
+        else:
+            spec = request.args.to_dict()
+            for name in range_fields:
+                if name in spec:
+                    spec[name] = [value or None for value in spec[name].split(",")]
+            specs = [spec]
+        queries = [api_query(spec) for spec in specs]
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    etag = hashlib.sha1(repr((dataset.version(), queries)).encode()).hexdigest()
+    if etag in request.if_none_match:
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    try:
+        masks = [filter_mask(*filters) for _, (filters, _, _) in queries]
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    games = dataset.get_data()
+    boards = [(cp_dict[color, piece], mask) for (_, (_, color, piece)), mask in zip(queries, masks)]
+    counts = fused_board_counts(games, boards)
+    results = fused_winner_counts(games, masks)
+    response = jsonify(
+        squares=[f"{file}{rank}" for rank in range(8, 0, -1) for file in "ABCDEFGH"],
+        results=[
+            {
+                "query": query,
+                "games": int(white + black + draw),
+                "white": int(white),
+                "black": int(black),
+                "draw": int(draw),
+                "counts": board.tolist(),
+            }
+            for (query, _), board, (white, black, draw) in zip(queries, counts, results)
+        ],
+    )
+    response.set_etag(etag)
+    # Cached, but checked with the ETag before each use.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@server.route("/view.json")
+def view_json():
+    """The figures of the view of a URL query string (see view_search), for
+    pages embedding a shared view. Responses are public: non-canonical query
+    strings are redirected to the canonical one, so a CDN caches each view
+    once."""
+    if not dataset.is_ready():
+        return jsonify(status=dataset.status()), 503
+    search = "?" + request.query_string.decode() if request.query_string else ""
+    try:
+        filters, color, piece, compare, heatmap = parse_view(search)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    canonical = view_search(filters, color, piece, compare, heatmap)
+    if search != canonical:
+        return redirect("/view.json" + canonical)
+    etag = hashlib.sha1(repr((dataset.version(), search)).encode()).hexdigest()
+    if etag in request.if_none_match:
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+    outputs = cached_view(search)
+    if outputs is None:
+        filters = parse_view(search)[0]
+        with_baseline = heatmap in ["lift", "difference"]
+        key = result_key(filters, color, piece, compare, with_baseline)
+        result = jobs.load(key)
+        if result is None and scanned_rows(filters, compare) > job_min_rows:
+            job = jobs.submit(
+                "view.json", key, board_result, filters, color, piece, compare, with_baseline
+            )
+            response = jsonify(status=job.state, progress=job.progress)
+            response.headers["Retry-After"] = "2"
+            return response, 202
+        if result is None:
+            result = board_result(filters, color, piece, compare, with_baseline)
+        outputs = render_view(filters, color, piece, compare, heatmap, result)
+        cache_view(search, outputs)
+    if not outputs:
+        return jsonify(error="No games match this view"), 404
+
+    figures = [outputs["chessboard"]]
+    if outputs["chessboard_compare"] is not dash.no_update:
+        figures.append(outputs["chessboard_compare"])
+    # The figures hold numpy arrays, encoded as Dash does.
+    body = {
+        "search": search,
+        "boards": figures,
+        "labels": outputs["labels"][: len(figures)],
+        "stackedbar": outputs["stackedbar"],
+        "games": outputs["games"],
+        "results": dict(zip(["white", "black", "draw"], outputs["results"])),
+    }
+    response = Response(
+        json.dumps(body, cls=plotly.utils.PlotlyJSONEncoder), mimetype="application/json"
     )
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={view_max_age}"
+    return response
 
 
 # Statring the dash app
@@ -15,12 +15,14 @@ from whitenoise import WhiteNoise
 
 from chessboard import getChessboard, getHeatmap, getStackedBar, getBoard
 from styles import *
+from data_source import resolve_data_path
 
 # Read the .csv file with the preprocessed data.
-url = "https://raw.githubusercontent.com/Exileus/DataVis2021_proj2/main/chess_app.csv"
+# See data_source.py for how the file is located; no network access happens here.
 df_original = pd.read_csv(
-    url,
+    resolve_data_path(),
     sep=",",
+    memory_map=True,
     dtype={"pawns": int, "knights": int, "bishops": int, "rooks": int, "queens": int},
     converters={
         "wKing_sqr": ast.literal_eval,
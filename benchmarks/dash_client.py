@@ -0,0 +1,51 @@
+"""Build /_dash-update-component requests the way the Dash renderer does."""
+
+DEFAULT_VALUES = {
+    "elo_slider.value": [0, 4000],
+    "moves_slider.value": [0, 1000],
+    # The view of the page (see app.parse_view), the default one.
+    "url.search": "",
+    # The rating sliders have no value until the data is loaded.
+    "white_elo_slider.value": None,
+    "black_elo_slider.value": None,
+    "elo_difference_slider.value": None,
+}
+
+
+def find_callback(dependencies, output):
+    """The callback in the /_dash-dependencies listing that has output among its outputs."""
+    for callback in dependencies:
+        if output in callback["output"].strip(".").split("..."):
+            return callback
+    raise KeyError(output)
+
+
+def callback_body(callback, trigger, values=None):
+    """Request body for callback, as fired by a change of the trigger property.
+
+    values maps "id.property" to the current value of each input and state;
+    n_clicks inputs default to 0 and the sliders to their widest range, or no value.
+    """
+    current = dict(DEFAULT_VALUES, **(values or {}))
+
+    def props(dependencies):
+        return [
+            {
+                "id": d["id"],
+                "property": d["property"],
+                "value": current.get(f"{d['id']}.{d['property']}", 0),
+            }
+            for d in dependencies
+        ]
+
+    outputs = [
+        dict(zip(("id", "property"), output.split(".")))
+        for output in callback["output"].strip(".").split("...")
+    ]
+    return {
+        "output": callback["output"],
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": props(callback["inputs"]),
+        "state": props(callback.get("state", [])),
+        "changedPropIds": [trigger],
+    }
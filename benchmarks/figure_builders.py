@@ -0,0 +1,91 @@
+"""Check the raw dict figure builders against the plotly ones and time both.
+
+Run from the repository root:
+    python benchmarks/figure_builders.py [--repeat 200]
+
+Fails with an AssertionError if getChessboardDict, getHeatmapDict or
+getStackedBarDict differ from compact_figure applied to getChessboard,
+getHeatmap or getStackedBar.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chessboard import (
+    getChessboard,
+    getChessboardDict,
+    getHeatmap,
+    getHeatmapDict,
+    getStackedBar,
+    getStackedBarDict,
+    heatmap_frame,
+)
+from serialization import compact_figure
+
+# (white wins, black wins, draws)
+STACKED_BARS = [(2534, 2283, 183), (712, 626, 0), (0, 0, 31), (1, 2, 3)]
+
+
+def plotly_chessboard(board):
+    import pandas as pd
+
+    chessboard = getChessboard(800)
+    chessboard.add_trace(getHeatmap(dataframe=heatmap_frame(pd.DataFrame(board))))
+    return compact_figure(chessboard)
+
+
+def dict_chessboard(board):
+    chessboard = getChessboardDict(800)
+    chessboard["data"].append(getHeatmapDict(board))
+    return chessboard
+
+
+def check_equivalence(boards):
+    for board in boards:
+        assert plotly_chessboard(board) == dict_chessboard(board)
+    for results in STACKED_BARS:
+        assert compact_figure(getStackedBar(normalized(*results))) == getStackedBarDict(*results)
+
+
+def normalized(white, black, draw):
+    # The results as update_chessboard used to pass them to getStackedBar.
+    import pandas as pd
+
+    winners = pd.Series(["WHITE"] * white + ["BLACK"] * black + ["DRAW"] * draw)
+    return np.round(winners.value_counts(normalize=True), 4).to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    boards = [rng.integers(0, 500, (8, 8)).astype(float), np.zeros((8, 8))]
+    boards[0][0, 0] = 0
+    check_equivalence(boards)
+    print("dict builders match the plotly figures")
+
+    cases = {
+        "chessboard + heatmap": (
+            lambda: plotly_chessboard(boards[0]),
+            lambda: dict_chessboard(boards[0]),
+        ),
+        "stacked bar": (
+            lambda: compact_figure(getStackedBar(normalized(*STACKED_BARS[0]))),
+            lambda: getStackedBarDict(*STACKED_BARS[0]),
+        ),
+    }
+    for name, (plotly_version, dict_version) in cases.items():
+        before = timeit.timeit(plotly_version, number=args.repeat) / args.repeat * 1000
+        after = timeit.timeit(dict_version, number=args.repeat) / args.repeat * 1000
+        print(f"{name:<22} plotly {before:8.3f} ms   dict {after:8.3f} ms   {before / after:6.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Profile how long it takes to import the app and to get the data ready.
+
+Run from the repository root:
+    python benchmarks/import_time.py [--top 15] [--json results.json]
+
+Each measurement runs in a fresh interpreter, using `python -X importtime`
+for the per-module breakdown.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMING_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+import dataset
+dataset.get_data()
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t0)
+"""
+
+
+def run_python(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def parse_importtime(stderr):
+    # Lines look like: "import time:  self [us] | cumulative | imported package"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    import_s, ready_s = [], []
+    for _ in range(args.repeat):
+        t_import, t_ready = map(float, run_python(TIMING_SCRIPT).stdout.split())
+        import_s.append(t_import)
+        ready_s.append(t_ready)
+
+    modules = parse_importtime(run_python("import app", "-X", "importtime").stderr)
+    top_level = [m for m in modules if "." not in m[0].strip()]
+    top_level.sort(key=lambda m: m[2], reverse=True)
+
+    results = {
+        "import_app_s": min(import_s),
+        "data_ready_s": min(ready_s),
+        "top_imports": [
+            {"module": name, "cumulative_ms": cumulative / 1000}
+            for name, _, cumulative in top_level[: args.top]
+        ],
+        "heavy_modules_loaded": {
+            name: any(m[0] == name for m in modules)
+            for name in ["pandas", "plotly.express"]
+        },
+    }
+
+    print(f"import app:   {results['import_app_s'] * 1000:8.1f} ms")
+    print(f"data ready:   {results['data_ready_s'] * 1000:8.1f} ms")
+    print("slowest top-level imports:")
+    for entry in results["top_imports"]:
+        print(f"  {entry['module']:<32} {entry['cumulative_ms']:8.1f} ms")
+    for name, loaded in results["heavy_modules_loaded"].items():
+        print(f"{name} imported by `import app`: {loaded}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
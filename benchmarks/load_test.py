@@ -0,0 +1,245 @@
+"""Load test the Dash callback endpoint with simulated users.
+
+Run from the repository root, either against a server that is already up:
+    python benchmarks/load_test.py --url http://127.0.0.1:8050 --users 20 --duration 60
+or letting the harness start gunicorn itself (everything stays local):
+    python benchmarks/load_test.py --start --workers 2 --users 20 --duration 60
+
+Each user replays a realistic click sequence (piece and color toggles, slider
+drags, dropdown changes) against /_dash-update-component, keeping its inputs
+in sync with the responses like the browser does. The report gives latency
+percentiles, throughput and the resident memory of the server processes.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dash_client import callback_body, find_callback
+
+PIECES = ["King", "Queen", "Rook", "Bishop", "Knight"]
+COLORS = ["white_color", "black_color"]
+DROPDOWNS = [
+    ["st_all", "st_draw", "st_mate", "st_resign", "st_outoftime"],
+    ["wn_all", "wn_white", "wn_black"],
+    ["tc_all", "tc_blitz", "tc_bullet", "tc_classic", "tc_none"],
+    ["gt_all", "gt_std", "gt_tourney"],
+    ["cmp_off", "cmp_colors", "cmp_elo", "cmp_status"],
+]
+# Relative frequency of each kind of interaction.
+ACTIONS = {"piece": 4, "color": 2, "dropdown": 2, "elo_drag": 1, "moves_drag": 1}
+
+
+def http_json(url, body=None, timeout=60):
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(
+        url, data=data, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, response.read()
+
+
+class User(threading.Thread):
+    def __init__(self, base_url, callback, stop, think_time, seed, drag_steps=1):
+        super().__init__(daemon=True)
+        self.drag_steps = drag_steps
+        self.base_url = base_url
+        self.callback = callback
+        self.stop = stop
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.values = {"elo_slider.value": [800, 2600], "moves_slider.value": [0, 300]}
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+
+    def click(self, component):
+        prop = f"{component}.n_clicks"
+        self.values[prop] = self.values.get(prop, 0) + 1
+        self.send(prop)
+
+    def drag(self, prop, low, high):
+        start, end = self.values[prop]
+        target = sorted(self.random.sample(range(low, high), 2))
+        for step in range(1, self.drag_steps + 1):
+            self.values[prop] = [
+                start + (target[0] - start) * step // self.drag_steps,
+                end + (target[1] - end) * step // self.drag_steps,
+            ]
+            self.send(prop)
+
+    def send(self, trigger):
+        body = callback_body(self.callback, trigger, self.values)
+        start = time.perf_counter()
+        try:
+            status, data = http_json(self.base_url + "/_dash-update-component", body)
+        except (urllib.error.URLError, OSError):
+            self.errors += 1
+            return
+        self.latencies.append(time.perf_counter() - start)
+        self.bytes += len(data)
+        if status == 200:
+            response = json.loads(data).get("response", {})
+            moves = response.get("moves_slider", {}).get("value")
+            if moves is not None:
+                self.values["moves_slider.value"] = moves
+            # Each user keeps the view of its page in its URL.
+            search = response.get("url", {}).get("search")
+            if search is not None:
+                self.values["url.search"] = search
+
+    def run(self):
+        actions = list(ACTIONS)
+        weights = list(ACTIONS.values())
+        while not self.stop.is_set():
+            action = self.random.choices(actions, weights)[0]
+            if action == "piece":
+                self.click(self.random.choice(PIECES))
+            elif action == "color":
+                self.click(self.random.choice(COLORS))
+            elif action == "dropdown":
+                self.click(self.random.choice(self.random.choice(DROPDOWNS)))
+            elif action == "elo_drag":
+                self.drag("elo_slider.value", 800, 2600)
+            else:
+                self.drag("moves_slider.value", 0, 120)
+            time.sleep(self.random.expovariate(1 / self.think_time))
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of pid and its children, from /proc (Linux only)."""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending += [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+    return total
+
+
+def start_server(port, workers, threads):
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "app:server",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers),
+            "--threads", str(threads),
+        ],
+        cwd=ROOT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if http_json(base_url + "/readyz", timeout=2)[0] == 200:
+                return server, base_url
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("server did not become ready within 120s")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8050")
+    parser.add_argument("--start", action="store_true", help="start gunicorn locally")
+    parser.add_argument("--port", type=int, default=8051)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds between actions")
+    parser.add_argument(
+        "--drag-steps",
+        type=int,
+        default=1,
+        help="requests per slider drag: 1 when sliders update on release, more to "
+        "model CHESS_SLIDER_THROTTLE_MS",
+    )
+    parser.add_argument("--server-pid", type=int, help="pid to sample memory from, with --url")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    server = None
+    base_url, server_pid = args.url.rstrip("/"), args.server_pid
+    if args.start:
+        server, base_url = start_server(args.port, args.workers, args.threads)
+        server_pid = server.pid
+
+    try:
+        dependencies = json.loads(http_json(base_url + "/_dash-dependencies")[1])
+        callback = find_callback(dependencies, "chessboard.figure")
+
+        stop = threading.Event()
+        users = [
+            User(base_url, callback, stop, args.think_time, seed, args.drag_steps)
+            for seed in range(args.users)
+        ]
+        memory = []
+        start = time.perf_counter()
+        for user in users:
+            user.start()
+        while time.perf_counter() - start < args.duration:
+            if server_pid is not None:
+                memory.append(process_tree_rss(server_pid))
+            time.sleep(1)
+        stop.set()
+        for user in users:
+            user.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+    latencies = [l for user in users for l in user.latencies]
+    if not latencies:
+        sys.exit("no successful requests")
+    report = {
+        "users": args.users,
+        "workers": args.workers if args.start else None,
+        "duration_s": elapsed,
+        "requests": len(latencies),
+        "errors": sum(user.errors for user in users),
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "mean": statistics.mean(latencies) * 1000,
+        },
+        "response_kb_mean": sum(user.bytes for user in users) / len(latencies) / 1024,
+        "server_rss_mb": {"max": max(memory) / 2 ** 20, "last": memory[-1] / 2 ** 20}
+        if memory
+        else None,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Benchmark the callback and figure-building hot paths on synthetic data.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py --sizes 10k,100k,1m --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+
+Each size gets a freshly generated dataset (see synthetic.py). Results are
+written as JSON; --compare prints the ratio to an earlier results file so
+regressions show up as ratios above 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dataset
+import export
+from dash_client import callback_body, find_callback
+from synthetic import synthetic_games
+
+SUFFIXES = {"k": 10 ** 3, "m": 10 ** 6}
+
+# (label, filter_mask arguments); the elo and moves ranges cover every game.
+FILTERS = [
+    ("all", (0, 4000, 0, 1000, ".*", ".*", ".*", ".*")),
+    ("mate_white_blitz", (0, 4000, 0, 1000, "mate", "white", "Blitz", ".*")),
+    ("elo_band_tournament", (1500, 1800, 20, 60, ".*", ".*", ".*", "tournament")),
+    # Only the rows of April are scanned (see dataset.date_rows).
+    ("april", (0, 4000, 0, 1000, ".*", ".*", ".*", ".*", None, None, None, None, None, "2017-04-01", "2017-04-30")),
+    # Only the games of the material index are read (see aggregates.material_rows).
+    ("rook_endings", (0, 4000, 0, 1000, ".*", ".*", ".*", ".*", None, "rook")),
+    ("april_mate_white_blitz", (0, 4000, 0, 1000, "mate", "white", "Blitz", ".*", None, None, None, None, None, "2017-04-01", "2017-04-30")),
+]
+
+# (label, trigger, input values) for full update_chessboard invocations. Each
+# starts from the view of the page's URL, the default view unless given.
+CALLBACKS = [
+    ("initial", "King.n_clicks", {}),
+    ("rook", "Rook.n_clicks", {"Rook.n_clicks": 1}),
+    ("elo_slider", "elo_slider.value", {"elo_slider.value": [1500, 1800]}),
+    ("compare_colors", "cmp_colors.n_clicks", {"cmp_colors.n_clicks": 1}),
+    ("heatmap_lift", "hm_lift.n_clicks", {"hm_lift.n_clicks": 1}),
+    ("compare_off", "cmp_off.n_clicks", {"cmp_off.n_clicks": 1}),
+    ("heatmap_counts", "hm_counts.n_clicks", {"hm_counts.n_clicks": 1}),
+]
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+def measure(function, repeat):
+    # One untimed call first: plotly loads its validators lazily on first use.
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.mean(times),
+        "repeat": repeat,
+    }
+
+
+def bench_size(app, client, callback, n_games, repeat):
+    import pandas
+
+    from aggregates import (
+        board_counts,
+        conditional_board_counts,
+        conditional_counts,
+        fused_board_counts,
+        mate_square_table,
+        square_games,
+    )
+    from chessboard import (
+        getChessboard,
+        getChessboardDict,
+        getHeatmap,
+        getHeatmapDict,
+        getStackedBar,
+        getStackedBarDict,
+        heatmap_frame,
+    )
+
+    dataset.use_games(synthetic_games(n_games))
+    # The indexed games, sorted by date, as the app sees them.
+    games = dataset.get_data()
+    app.filter_mask.cache_clear()
+    results = {}
+
+    for label, args in FILTERS:
+        results[f"filter_mask[{label}]"] = measure(
+            lambda: app.filter_mask.__wrapped__(*args), repeat
+        )
+    # The same material filter, tested on every game.
+    results["select_games[rook_endings, scan]"] = measure(
+        lambda: app.select_games(games, *dict(FILTERS)["rook_endings"]), repeat
+    )
+    results["filter_mask[cached]"] = measure(lambda: app.filter_mask(*FILTERS[0][1]), repeat)
+    # The most played opening: filtered alone, its rows come from the eco index
+    # and its boards from eco_square_table.
+    opening = (*FILTERS[0][1], games["ECO"].value_counts().index[0], *[None] * 6)
+    results["filter_mask[opening]"] = measure(
+        lambda: app.filter_mask.__wrapped__(*opening), repeat
+    )
+    results["board_vectors[opening]"] = measure(
+        lambda: app.board_vectors.__wrapped__(opening, "white_color", "Rook", None), repeat
+    )
+
+    # Whole rating bins of each side: prefix sums of dataset.rating_table,
+    # against counting the games of the same mask.
+    ratings = (*FILTERS[0][1], None, None, (1500, 1800), (1200, 1600), None, None, None)
+    ratings_mask = app.filter_mask(*ratings)
+    results["board_vectors[ratings]"] = measure(
+        lambda: app.board_vectors.__wrapped__(ratings, "white_color", "Rook", None), repeat
+    )
+    results["board_counts[ratings]"] = measure(
+        lambda: board_counts(games, ratings_mask, app.cp_dict["white_color", "Rook"]), repeat
+    )
+    # Results and moves range of the same view, against the mask of its games.
+    results["view_totals[ratings]"] = measure(lambda: app.view_totals.__wrapped__(ratings), repeat)
+    results["filter_mask[ratings]"] = measure(
+        lambda: app.filter_mask.__wrapped__(*ratings), repeat
+    )
+
+    mask = app.filter_mask(*FILTERS[0][1])
+    for piece in ["King", "Rook"]:
+        columns = app.cp_dict["white_color", piece]
+        results[f"board_counts[{piece}]"] = measure(
+            lambda: board_counts(games, mask, columns), repeat
+        )
+    # Two boards in one pass, against two separate passes.
+    boards = [(app.cp_dict[color, "Rook"], mask) for color in ["white_color", "black_color"]]
+    results["fused_board_counts[2 boards]"] = measure(
+        lambda: fused_board_counts(games, boards), repeat
+    )
+    results["board_counts[2 boards]"] = measure(
+        lambda: [board_counts(games, m, columns) for columns, m in boards], repeat
+    )
+
+    # Large datasets answer from a sample first (see app.approximate_chessboard).
+    if dataset.is_progressive():
+        dataset.get_table("sample")
+        band = (*FILTERS[2][1], None, None, None, None)
+        results["approximate_board[elo_band_tournament]"] = measure(
+            lambda: app.approximate_board(band, "white_color", "Rook"), repeat
+        )
+
+    # Games of a clicked square: the inverted index against a scan of the column.
+    index = dataset.get_table("square_index")
+    results["square_games[index]"] = measure(
+        lambda: square_games(index, ["wKing_sqr"], 60, mask), repeat
+    )
+    results["square_games[scan]"] = measure(
+        lambda: (mask & (games["wKing_sqr"].to_numpy() == 60)).nonzero()[0], repeat
+    )
+
+    # Board of a piece given the square of another: a slice of the table
+    # precomputed at load time, against the games of the square in the index.
+    table = dataset.get_table("cooccurrence")
+    results["conditional_counts[table]"] = measure(
+        lambda: conditional_counts(table, "wQueen", "bKing", 14, list(range(12))), repeat
+    )
+    results["conditional_counts[index]"] = measure(
+        lambda: conditional_board_counts(games, index, mask, ["wQueen_sqr"], 14, ["bKing_sqr"]),
+        repeat,
+    )
+
+    # Streamed export of the games of a selection, consumed in full.
+    selected = app.filter_mask(*FILTERS[1][1]).nonzero()[0]
+    results["export.games_csv[mate_white_blitz]"] = measure(
+        lambda: sum(len(chunk) for chunk in export.games_csv(games, selected)), repeat
+    )
+
+    # Four boards of the JSON API in one request, counted in one pass.
+    batch = {
+        "queries": [
+            {"color": color, "piece": piece, "status": "mate"}
+            for color in ["white", "black"]
+            for piece in ["King", "Rook"]
+        ]
+    }
+    results["api_heatmaps[4 queries]"] = measure(
+        lambda: client.post("/api/heatmaps", json=batch), repeat
+    )
+
+    # Built once at load time; the checkmate view only reads it.
+    results["mate_square_table"] = measure(lambda: mate_square_table(games), repeat)
+
+    board = board_counts(games, mask, app.cp_dict["white_color", "Rook"]).reshape(8, 8)
+    frame = heatmap_frame(pandas.DataFrame(board))
+    results["getHeatmap"] = measure(lambda: getHeatmap(dataframe=frame), repeat)
+    results["getHeatmapDict"] = measure(lambda: getHeatmapDict(board), repeat)
+    results["getChessboard"] = measure(lambda: getChessboard(800), repeat)
+    results["getChessboardDict"] = measure(lambda: getChessboardDict(800), repeat)
+    game_results = {"WHITE": 0.5, "BLACK": 0.45, "DRAW": 0.05}
+    results["getStackedBar"] = measure(lambda: getStackedBar(game_results), repeat)
+    results["getStackedBarDict"] = measure(lambda: getStackedBarDict(500, 450, 50), repeat)
+
+    for label, trigger, values in CALLBACKS:
+        body = callback_body(callback, trigger, values)
+
+        def invoke():
+            app.filter_mask.cache_clear()
+            app.board_vectors.cache_clear()
+            app.view_cache.clear()
+            response = client.post("/_dash-update-component", json=body)
+            assert response.status_code == 200, response.status_code
+
+        results[f"update_chessboard[{label}]"] = measure(invoke, repeat)
+    return results
+
+
+def compare(results, previous):
+    print(f"\n{'benchmark':<44} {'before':>10} {'after':>10} {'ratio':>7}")
+    for size, benches in results["results"].items():
+        for name, stats in benches.items():
+            old = previous["results"].get(size, {}).get(name)
+            if old is None:
+                continue
+            ratio = stats["median_ms"] / old["median_ms"]
+            print(
+                f"{size + ' ' + name:<44} {old['median_ms']:10.2f} {stats['median_ms']:10.2f} {ratio:7.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k,1m", help="e.g. 10k,100k,1m,10m")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="print ratios against an earlier JSON file")
+    args = parser.parse_args()
+
+    import dash
+    import pandas
+    import plotly
+
+    # Installing synthetic data first keeps the app from loading the real dataset.
+    dataset.use_games(synthetic_games(10))
+    import app
+
+    client = app.server.test_client()
+    callback = find_callback(client.get("/_dash-dependencies").get_json(), "chessboard.figure")
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "versions": {
+                "dash": dash.__version__,
+                "pandas": pandas.__version__,
+                "plotly": plotly.__version__,
+            },
+        },
+        "results": {},
+    }
+    for size in args.sizes.split(","):
+        n_games = parse_size(size)
+        benches = bench_size(app, client, callback, n_games, args.repeat)
+        results["results"][str(n_games)] = benches
+        for name, stats in benches.items():
+            print(f"{n_games:>10} {name:<36} {stats['median_ms']:10.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
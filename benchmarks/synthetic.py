@@ -0,0 +1,135 @@
+"""Synthetic games with the schema of chess_app.csv.
+
+The proportions below were measured on the bundled chess_app.csv (April 2017
+sample), so filters select realistic fractions of the synthetic games.
+
+    python benchmarks/synthetic.py 1000000 games_1m.csv
+writes a .csv that the app can load through CHESS_DATA_PATH.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import SQUARE_COLUMNS
+
+TIME_CONTROLS = {"Blitz": 0.4636, "Bullet": 0.2958, "Classical": 0.2368, "Correspondence": 0.0038}
+TOURNAMENT_RATE = 0.1578
+VICTORY_STATUS = {"resign": 0.3608, "outoftime": 0.3422, "mate": 0.2676, "draw": 0.0294}
+WHITE_WIN_RATE = 0.526  # among decisive games
+MATED_BY = {"Queen": 0.663, "Rook": 0.26, "Knight": 0.0314, "Bishop": 0.0284, "Pawn": 0.0172}
+TIME_CONTROL_FORMATS = {
+    "Blitz": ["300+0", "180+0", "180+2", "300+3"],
+    "Bullet": ["60+0", "120+1", "30+0", "120+0"],
+    "Classical": ["600+0", "900+15", "1800+0"],
+    "Correspondence": ["-"],
+}
+# Fraction of games in which each piece has been captured by the end.
+CAPTURED_RATE = {
+    "King": 0.0,
+    "Queen": 0.49,
+    "Rook": 0.28,
+    "Rook2": 0.62,
+    "Bishop": 0.52,
+    "Bishop2": 0.85,
+    "Knight": 0.6,
+    "Knight2": 0.89,
+}
+# ECO codes A00 to E99, with a few popular openings played much more often.
+ECO_CODES = [f"{letter}{number:02d}" for letter in "ABCDE" for number in range(100)]
+ECO_ZIPF_EXPONENT = 1.1
+# Games are spread evenly over a year.
+FIRST_DATE = np.datetime64("2017-01-01")
+DAYS = 365
+END_FENS = [
+    "r1b2q1b/pp1pkB1r/2pN4/4P1Q1/1n1P3P/2N5/PPPK1RP1/8 b - - 0 19",
+    "6k1/pp1b1p1p/1b1B1Q2/3B4/3P3N/2P3K1/PP4PP/r7 b - - 0 24",
+    "8/8/4k3/8/2K5/8/8/8 w - - 0 61",
+    "r4rk1/pp3ppp/2n5/3q4/3P4/5N2/PP3PPP/R2Q1RK1 w - - 0 17",
+]
+
+
+def _choice(rng, weights, n):
+    keys = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()))
+    return keys[rng.choice(len(keys), size=n, p=p / p.sum())]
+
+
+def synthetic_games(n, seed=0):
+    """Return n games, with the square columns already encoded as in dataset.py."""
+    rng = np.random.default_rng(seed)
+
+    time_control = _choice(rng, TIME_CONTROLS, n)
+    tournament = rng.random(n) < TOURNAMENT_RATE
+    event = np.where(
+        tournament,
+        "Rated " + time_control + " tournament https://lichess.org/tournament/synthetic",
+        "Rated " + time_control + " game",
+    ).astype(object)
+    time_control_format = np.empty(n, dtype=object)
+    for name, formats in TIME_CONTROL_FORMATS.items():
+        rows = time_control == name
+        time_control_format[rows] = np.array(formats, dtype=object)[
+            rng.integers(len(formats), size=rows.sum())
+        ]
+
+    victory_status = _choice(rng, VICTORY_STATUS, n)
+    winner = np.where(rng.random(n) < WHITE_WIN_RATE, "white", "black").astype(object)
+    winner[victory_status == "draw"] = "draw"
+    mated_by = np.full(n, np.nan, dtype=object)
+    mates = victory_status == "mate"
+    mated_by[mates] = _choice(rng, MATED_BY, mates.sum())
+
+    # Openings by popularity rank, in a shuffled order of the codes.
+    ranks = np.arange(1, len(ECO_CODES) + 1) ** -ECO_ZIPF_EXPONENT
+    eco = np.array(ECO_CODES, dtype=object)[rng.permutation(len(ECO_CODES))]
+    eco = eco[rng.choice(len(ECO_CODES), size=n, p=ranks / ranks.sum())]
+
+    dates = np.array(
+        [str(FIRST_DATE + day).replace("-", ".") for day in range(DAYS)], dtype=object
+    )
+
+    games = pd.DataFrame(
+        {
+            "Event": event,
+            "UTCDate": dates[rng.integers(DAYS, size=n)],
+            "TimeControl": time_control_format,
+            "endFEN": np.array(END_FENS, dtype=object)[rng.integers(len(END_FENS), size=n)],
+            "moves": np.clip(rng.normal(34.3, 15.5, n).round(), 1, 300).astype(np.int64),
+            "mated_by": mated_by,
+            "Winner": winner,
+            "victory_status": victory_status,
+            "ECO": eco,
+            "Opening": "Opening " + eco,
+        }
+    )
+    for col in SQUARE_COLUMNS:
+        squares = rng.integers(64, size=n, dtype=np.int8)
+        squares[rng.random(n) < CAPTURED_RATE[col[1:-4]]] = -1
+        games[col] = squares
+    games["avg_Elo"] = np.clip(rng.normal(1644, 282, n), 800, 2800).round() / 1
+    # Ratings of each side around the average, as in the PGN headers.
+    difference = rng.normal(0, 150, n).round() * 2
+    games["WhiteElo"] = (games["avg_Elo"] + difference / 2).astype(np.int64)
+    games["BlackElo"] = (games["avg_Elo"] - difference / 2).astype(np.int64)
+    return games
+
+
+def to_csv(games, path):
+    """Write games in the chess_app.csv format, with "(row, col)" squares."""
+    labels = np.array(
+        [f"({s // 8}, {s % 8})" for s in range(64)] + ["(None, None)"], dtype=object
+    )
+    out = games.copy()
+    for col in SQUARE_COLUMNS:
+        out[col] = labels[out[col].to_numpy()]  # -1 picks the last label
+    out.to_csv(path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python benchmarks/synthetic.py N_GAMES OUTPUT.csv")
+    to_csv(synthetic_games(int(sys.argv[1])), sys.argv[2])
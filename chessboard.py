@@ -1,10 +1,14 @@
+import functools
+
 import plotly.graph_objects as go
-import pandas as pd
 import numpy as np
-import plotly.express as px
+
+from serialization import TYPED_ARRAYS, compact_figure, typed_array
 
 # Define function to output an 8*8 dataframe based on a vector of coordinates.
 def board_output(vector):
+    import pandas as pd
+
     brd = np.zeros((8, 8))
     for tup in vector:
         brd[tup] += 1
@@ -13,7 +17,10 @@ def board_output(vector):
 
 
 def getStackedBar(dictionary):
-    print(dictionary)
+    # plotly.express and pandas are slow to import and only needed here.
+    import pandas as pd
+    import plotly.express as px
+
     fig = px.bar(
         pd.DataFrame({"Games": dictionary}).T * 100,
         height=50,
@@ -73,12 +80,12 @@ def getChessboard(dimensions: int = 600, margin: int = 50):
             ),
         )
     )
-    getBoard(chessboard)
+    # Squares are 87.5px on the 800px board, and scale with the plot area.
+    getBoard(chessboard, size=87.5 * (dimensions - 2 * margin) / 700)
     return chessboard
 
 
-def getBoard(fig):
-    size = 87.5
+def getBoard(fig, size: float = 87.5):
     x_black = []
     for i in range(8):
         if (i % 2) == 0:
@@ -132,7 +139,7 @@ def getBoard(fig):
     )
 
 
-def getHeatmap(dataframe: pd.DataFrame):
+def getHeatmap(dataframe: "pd.DataFrame"):
     """DataFrame must have columns named:
     rows => 1 to 8
     letters => A to H
@@ -153,7 +160,8 @@ def getHeatmap(dataframe: pd.DataFrame):
         marker_symbol="square",
         marker_line_color="#c12917",
         marker_size=freq,
-        marker_sizeref=freq.max() / 60,
+        # An empty board has no size to scale: plotly.js needs a positive sizeref.
+        marker_sizeref=freq.max() / 60 if freq.max() else 1.0,
         marker_sizemin=0,
         marker_sizemode="diameter",
         marker_opacity=1,
@@ -163,4 +171,132 @@ def getHeatmap(dataframe: pd.DataFrame):
         # TODO
         hovertemplate="<b># Games:</b> %{hovertext}<extra></extra>",
     )
-    return heatmap
\ No newline at end of file
+    return heatmap
+
+# Transform an 8*8 board into the long format expected by getHeatmap.
+def heatmap_frame(df):
+    df = (
+        df.stack()
+        .reset_index()
+        .rename(columns={"level_0": "rows", "level_1": "cols", 0: "freq"})
+    )
+
+    df["rows"] = df["rows"].replace({i: list(range(8))[::-1][i] for i in range(8)})
+    return df
+
+
+# Raw dict versions of the figures above, for the callbacks.
+# plotly validates every property of go/px figures as they are built. These
+# functions build each figure with plotly once, keep it as a compact dict
+# (see serialization.py) and only fill in the data on each call. They return
+# the same structure as compact_figure applied to the plotly versions.
+# The templates are shared between calls: copy before mutating anything other
+# than the "data" list and the traces added to it.
+
+# Heatmap coordinates in board_output order: row 0 of the board is rank 8.
+HEATMAP_X = np.tile(np.arange(8), 8)
+HEATMAP_Y = np.repeat(np.arange(8)[::-1], 8)
+
+
+@functools.lru_cache(maxsize=None)
+def chessboardTemplate(dimensions, margin):
+    return compact_figure(getChessboard(dimensions, margin))
+
+
+@functools.lru_cache(maxsize=None)
+def heatmapTemplate():
+    import pandas as pd
+
+    frame = pd.DataFrame({"rows": HEATMAP_Y, "cols": HEATMAP_X, "freq": np.ones(64)})
+    trace = compact_figure(go.Figure(getHeatmap(frame)))["data"][0]
+    for key in ["x", "y", "hovertext"]:
+        trace.pop(key)
+    trace["marker"] = {
+        k: v for k, v in trace["marker"].items() if k not in ["size", "sizeref"]
+    }
+    return trace
+
+
+@functools.lru_cache(maxsize=None)
+def stackedBarTemplate():
+    return compact_figure(getStackedBar({"BLACK": 1, "DRAW": 1, "WHITE": 1}))
+
+
+def getChessboardDict(dimensions: int = 600, margin: int = 50):
+    template = chessboardTemplate(dimensions, margin)
+    return {"data": list(template["data"]), "layout": template["layout"]}
+
+
+def getHeatmapDict(board, decimals: int = 2, max_size: float = 60, scale: float = None):
+    """Same trace as getHeatmap(heatmap_frame(board)), from an 8*8 array of counts.
+    Squares are drawn max_size pixels wide at a frequency of scale percent,
+    by default the highest frequency on the board. Boards shown side by side
+    should share the same scale."""
+    counts = np.asarray(board, dtype=float).ravel()
+    total = counts.sum()
+    freq = counts if total == 0 else np.round(counts / total * 100, decimals)
+    scale = freq.max() if scale is None else scale
+    trace = dict(heatmapTemplate())
+    trace["x"] = _compact(HEATMAP_X, decimals)
+    trace["y"] = _compact(HEATMAP_Y, decimals)
+    trace["hovertext"] = counts.astype(np.int64).tolist()
+    trace["marker"] = dict(
+        trace["marker"],
+        size=_compact(freq, decimals),
+        sizeref=float(scale / max_size) if scale else 1.0,
+    )
+    return trace
+
+
+# Colors of the squares of getMeasureHeatmapDict, for positive and negative values.
+MEASURE_COLORS = ("#c12917", "#1f5fa8")
+
+
+def getMeasureHeatmapDict(
+    values, hovertext, label: str, decimals: int = 2, max_size: float = 60, scale: float = None
+):
+    """Heatmap trace of a measure other than counts (see aggregates.py), from 64
+    values in board order. Squares are sized by the absolute values, and
+    negative values are drawn in the second MEASURE_COLORS color. The hover
+    shows label followed by hovertext."""
+    values = np.asarray(values, dtype=float).ravel()
+    sizes = np.abs(values)
+    scale = sizes.max() if scale is None else scale
+    trace = dict(heatmapTemplate())
+    trace["x"] = _compact(HEATMAP_X, decimals)
+    trace["y"] = _compact(HEATMAP_Y, decimals)
+    trace["hovertext"] = list(hovertext)
+    trace["hovertemplate"] = f"<b>{label}:</b> %{{hovertext}}<extra></extra>"
+    trace["marker"] = dict(
+        trace["marker"],
+        size=_compact(sizes, decimals),
+        sizeref=float(scale / max_size) if scale else 1.0,
+    )
+    if (values < 0).any():
+        colors = np.where(values < 0, MEASURE_COLORS[1], MEASURE_COLORS[0]).tolist()
+        trace["marker"]["color"] = colors
+        trace["marker"]["line"] = {"color": colors}
+    return trace
+
+
+def getStackedBarDict(white: int, black: int, draw: int, decimals: int = 2):
+    """Stacked bar of the game results, from the number of white wins, black wins
+    and draws. Same figure as getStackedBar with the normalized results."""
+    template = stackedBarTemplate()
+    total = white + black + draw
+    data = []
+    # Traces in the order of getStackedBar, omitting results with no games.
+    for trace, count in zip(template["data"], [black, draw, white]):
+        if count > 0:
+            share = np.round(count / total, 4) * 100
+            data.append(dict(trace, x=_compact([share], decimals)))
+    return {"data": data, "layout": template["layout"]}
+
+
+def _compact(values, decimals):
+    # Rounding as in serialization.compact_arrays, and typed arrays for x, y
+    # and marker.size with CHESS_TYPED_ARRAYS=1.
+    values = np.round(values, decimals)
+    if np.all(values == np.floor(values)):
+        values = values.astype(np.int64)
+    return typed_array(values) if TYPED_ARRAYS else values.tolist()
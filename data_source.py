@@ -0,0 +1,140 @@
+"""Locate the preprocessed dataset and keep a verified local copy of it.
+
+The data source is picked, in order, from:
+    CHESS_DATA_PATH => a local .csv file, used as is.
+    CHESS_DATA_URL  => a remote .csv file, served from the on-disk cache.
+    chess_app.csv   => the copy bundled next to this file.
+    DEFAULT_URL     => the GitHub copy, served from the on-disk cache.
+
+Remote files are never fetched at import time: run
+    python data_source.py prefetch
+once (e.g. in the build step) and every worker boots from the cache.
+Set CHESS_DATA_SHA256 to pin the expected content hash of the remote file.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import urllib.request
+
+DEFAULT_URL = "https://raw.githubusercontent.com/Exileus/DataVis2021_proj2/main/chess_app.csv"
+BUNDLED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chess_app.csv")
+CACHE_DIR = os.environ.get(
+    "CHESS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "chess_app")
+)
+CHUNK_SIZE = 1 << 20
+
+
+class DataSourceError(RuntimeError):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(url):
+    # One cache entry per url, so switching sources never serves stale data.
+    key = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{key}-{os.path.basename(url)}")
+
+
+def _read_meta(path):
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path, meta):
+    with open(path + ".json", "w") as f:
+        json.dump(meta, f)
+
+
+def verify_cached(path, sha256=None):
+    """Return True if the cached file exists and matches its recorded hash.
+    The file is only re-hashed when its size or mtime changed since download."""
+    meta = _read_meta(path)
+    if meta is None or not os.path.exists(path):
+        return False
+    if sha256 is not None and meta["sha256"] != sha256:
+        return False
+    stat = os.stat(path)
+    if stat.st_size == meta["size"] and stat.st_mtime == meta["mtime"]:
+        return True
+    if file_sha256(path) != meta["sha256"]:
+        return False
+    meta["size"], meta["mtime"] = stat.st_size, stat.st_mtime
+    _write_meta(path, meta)
+    return True
+
+
+def prefetch(url=DEFAULT_URL, sha256=None, force=False):
+    """Download url into the cache, verifying its content hash. Returns the path."""
+    path = cache_path(url)
+    if not force and verify_cached(path, sha256):
+        return path
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    # Write to a temporary file first so a failed download never leaves a partial cache entry.
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out, urllib.request.urlopen(url) as response:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise DataSourceError(
+                f"Hash mismatch for {url}: expected {sha256}, got {digest.hexdigest()}"
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    stat = os.stat(path)
+    _write_meta(
+        path,
+        {"url": url, "sha256": digest.hexdigest(), "size": stat.st_size, "mtime": stat.st_mtime},
+    )
+    return path
+
+
+def resolve_data_path():
+    """Return a local path to the dataset without touching the network."""
+    local_path = os.environ.get("CHESS_DATA_PATH")
+    if local_path:
+        if not os.path.exists(local_path):
+            raise DataSourceError(f"CHESS_DATA_PATH points to a missing file: {local_path}")
+        return local_path
+
+    url = os.environ.get("CHESS_DATA_URL")
+    if url is None and os.path.exists(BUNDLED_PATH):
+        return BUNDLED_PATH
+    url = url or DEFAULT_URL
+
+    path = cache_path(url)
+    if not verify_cached(path, os.environ.get("CHESS_DATA_SHA256")):
+        raise DataSourceError(
+            f"No verified cached copy of {url}. Run `python data_source.py prefetch` first."
+        )
+    return path
+
+
+if __name__ == "__main__":
+    # Usage: python data_source.py prefetch [url] [--force]
+    args = sys.argv[1:]
+    if not args or args[0] != "prefetch":
+        sys.exit("Usage: python data_source.py prefetch [url] [--force]")
+    force = "--force" in args
+    urls = [a for a in args[1:] if a != "--force"]
+    url = urls[0] if urls else os.environ.get("CHESS_DATA_URL", DEFAULT_URL)
+    print(prefetch(url, sha256=os.environ.get("CHESS_DATA_SHA256"), force=force))
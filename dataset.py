@@ -0,0 +1,391 @@
+"""Load the preprocessed dataset in a background thread.
+
+Importing the app only starts the load; workers can serve the layout while the
+.csv is read. Callbacks check is_ready() or block on get_data().
+The data path may also be a date-partitioned directory (see partitions.py).
+"""
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from data_source import resolve_data_path
+
+SQUARE_COLUMNS = [
+    "wKing_sqr",
+    "bKing_sqr",
+    "wQueen_sqr",
+    "bQueen_sqr",
+    "wRook_sqr",
+    "bRook_sqr",
+    "wRook2_sqr",
+    "bRook2_sqr",
+    "wBishop_sqr",
+    "bBishop_sqr",
+    "wBishop2_sqr",
+    "bBishop2_sqr",
+    "wKnight_sqr",
+    "bKnight_sqr",
+    "wKnight2_sqr",
+    "bKnight2_sqr",
+]
+
+# Squares are stored as "(row, col)" strings in the .csv. They are encoded as
+# row * 8 + col in an int8 column, with -1 for a captured piece, so that boards
+# can be counted with np.bincount instead of a python loop over tuples.
+SQUARE_CODES = {f"({r}, {c})": r * 8 + c for r in range(8) for c in range(8)}
+SQUARE_CODES["(None, None)"] = -1
+
+# Winner is also encoded, in a winner_code column, so that results can be
+# counted with a single np.bincount.
+WINNER_CODES = {"white": 0, "black": 1, "draw": 2}
+# Likewise victory_status, in a status_code column, for the comparison boards.
+STATUS_CODES = {"mate": 0, "resign": 1, "outoftime": 2, "draw": 3}
+
+# The material left on the board, from endFEN, is encoded per side in
+# w_material and b_material: 4 bits per piece type of MATERIAL_PIECES, pawns in
+# the lowest bits. Games are looked up by material in an index (see
+# aggregates.material_index).
+MATERIAL_PIECES = "PNBRQ"
+# Games whose FENs are read at once by material_signatures.
+material_chunk_rows = 100000
+
+# WhiteElo and BlackElo, when present, allow filters on the rating of each
+# side. Ratings are binned by rating_bin for the prefix sums of
+# aggregates.rating_square_table, so that selections on multiples of
+# rating_bin are counted without reading the games (see rating_table).
+rating_bin = 100
+difference_step = 50
+
+# UTCDate, when present, is encoded as date_code: days since 1970-01-01 in an
+# int32 column. Games are sorted by it, so any date range is a contiguous slice
+# of rows (see date_rows).
+
+# Datasets larger than progressive_min_rows also get a stratified sample of
+# about sample_size games, for approximate boards (see app.approximate_chessboard).
+# CHESS_PROGRESSIVE=1 or 0 forces this on or off.
+sample_size = int(os.environ.get("CHESS_SAMPLE_SIZE", "20000"))
+progressive_min_rows = 10 * sample_size
+progressive_setting = os.environ.get("CHESS_PROGRESSIVE", "auto")
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_thread = None
+_games = None
+_tables = None
+_error = None
+_indexing = False
+_version = None
+
+
+def read_games(path):
+    # pandas is imported here so that it is loaded off the request path.
+    import pandas as pd
+
+    if os.path.isdir(path):
+        return read_partitions(
+            path, os.environ.get("CHESS_DATA_START"), os.environ.get("CHESS_DATA_END")
+        )
+    return pd.read_csv(
+        path,
+        sep=",",
+        memory_map=True,
+        dtype={"pawns": int, "knights": int, "bishops": int, "rooks": int, "queens": int},
+    )
+
+
+def read_partitions(root, start=None, end=None):
+    """Read the games from start to end (YYYY-MM-DD, inclusive) of a
+    partitioned dataset, opening only the partitions of that range."""
+    import pandas as pd
+
+    from partitions import select_partitions
+
+    games = pd.concat(
+        [read_games(path) for path in select_partitions(root, start, end)],
+        ignore_index=True,
+    )
+    # The first and last partitions may start before or end after the range.
+    dates = games["UTCDate"].str.replace(".", "-", regex=False)
+    keep = (dates >= (start or "")) & (dates <= (end or "9999"))
+    return games if keep.all() else games[keep].reset_index(drop=True)
+
+
+def date_code(date):
+    """Days since 1970-01-01 of a "YYYY-MM-DD" or "YYYY.MM.DD" date."""
+    return int(np.datetime64(date[:10].replace(".", "-"), "D").astype(np.int64))
+
+
+def material_signatures(fens, chunk_rows=material_chunk_rows):
+    """Packed material of each side of FEN positions (see MATERIAL_PIECES).
+    Returns (white, black) int32 arrays. Only the placement field of the FEN,
+    up to its first space, is counted. The FENs are read as bytes chunk_rows
+    at a time, so the byte arrays stay small on large datasets."""
+    fens = np.asarray(fens, dtype=object)
+    white = np.zeros(len(fens), dtype=np.int32)
+    black = np.zeros(len(fens), dtype=np.int32)
+    for start in range(0, len(fens), chunk_rows):
+        chunk = slice(start, start + chunk_rows)
+        chars = np.asarray(fens[chunk], dtype=bytes)
+        chars = chars.view(np.uint8).reshape(len(chars), -1)
+        # Characters from the first space on are not part of the placement.
+        spaces = chars == ord(" ")
+        end = np.where(spaces.any(axis=1), spaces.argmax(axis=1), chars.shape[1])
+        chars = np.where(np.arange(chars.shape[1]) < end[:, np.newaxis], chars, 0)
+        for i, piece in enumerate(MATERIAL_PIECES):
+            white[chunk] |= (chars == ord(piece)).sum(axis=1, dtype=np.int32) << (4 * i)
+            black[chunk] |= (chars == ord(piece.lower())).sum(axis=1, dtype=np.int32) << (4 * i)
+    return white, black
+
+
+def build_indexes(games):
+    """Encode the square columns in place and add winner_code and status_code
+    (see SQUARE_CODES). Square columns that are already encoded are left as they are.
+    Datasets with an ECO column also get eco_code, the index of the game's
+    opening in the sorted ECO codes (-1 if unknown), datasets with an endFEN
+    column get w_material and b_material, and datasets with a UTCDate column
+    get date_code and are sorted by date, in a new DataFrame."""
+    for col in SQUARE_COLUMNS:
+        if games[col].dtype == object:
+            games[col] = games[col].map(SQUARE_CODES).astype("int8")
+    games["winner_code"] = games["Winner"].map(WINNER_CODES).astype("int8")
+    games["status_code"] = games["victory_status"].map(STATUS_CODES).astype("int8")
+    if "ECO" in games:
+        games["ECO"] = games["ECO"].astype("category")
+        games["eco_code"] = games["ECO"].cat.codes.astype("int16")
+    if "endFEN" in games:
+        games["w_material"], games["b_material"] = material_signatures(games["endFEN"].to_numpy())
+    if "UTCDate" in games:
+        dates = games["UTCDate"].str.replace(".", "-", regex=False).to_numpy(dtype="datetime64[D]")
+        games["date_code"] = dates.astype(np.int32)
+        if not games["date_code"].is_monotonic_increasing:
+            games = games.sort_values("date_code", kind="stable", ignore_index=True)
+    return games
+
+
+# The co-occurrence table is counted by status and winner, so the filters of
+# those two menus are answered from it (see cooccurrence_buckets).
+n_cooccurrence_buckets = len(STATUS_CODES) * len(WINNER_CODES)
+
+
+def cooccurrence_buckets(games):
+    """Bucket of each game in the co-occurrence table: status_code * 3 + winner_code."""
+    return games["status_code"].to_numpy() * len(WINNER_CODES) + games["winner_code"].to_numpy()
+
+
+def rating_table(games):
+    """Bounds of the ratings of both sides, as multiples of rating_bin (the
+    last one excluded), a multiple of difference_step above every rating
+    difference, and the prefix sums of the board counts and results by
+    rating, with the moves range of each pair of bins. Games without both
+    ratings are left out, as rating filters leave them out (see
+    app.select_games)."""
+    from aggregates import cell_totals, rating_square_table
+
+    white = games["WhiteElo"].to_numpy(dtype=float)
+    black = games["BlackElo"].to_numpy(dtype=float)
+    known = np.isfinite(white) & np.isfinite(black)
+    if not known.any():
+        return None
+    first = int(min(white[known].min(), black[known].min()) // rating_bin) * rating_bin
+    stop = int(max(white[known].max(), black[known].max()) // rating_bin + 1) * rating_bin
+    bins = [np.where(known, (elo - first) // rating_bin, -1).astype(np.int64) for elo in [white, black]]
+    difference = np.abs(white[known] - black[known]).max()
+    n_bins = (stop - first) // rating_bin
+    cells = np.where(known, bins[0] * n_bins + bins[1], -1)
+    results, moves = cell_totals(
+        cells, n_bins * n_bins, games["winner_code"].to_numpy(), games["moves"].to_numpy()
+    )
+    prefix = np.zeros((n_bins + 1, n_bins + 1, 3), dtype=np.int64)
+    prefix[1:, 1:] = results.reshape(n_bins, n_bins, 3).cumsum(axis=0).cumsum(axis=1)
+    prefix.setflags(write=False)
+    return {
+        "bounds": (first, stop),
+        "max_difference": int((difference // difference_step + 1) * difference_step),
+        "squares": rating_square_table(games, SQUARE_COLUMNS, *bins, n_bins),
+        "results": prefix,
+        "moves": moves.reshape(n_bins, n_bins, 2),
+    }
+
+
+def build_tables(games):
+    """Precompute the count tables that are served without filtering the games
+    (see aggregates.py), from indexed games."""
+    from aggregates import (
+        cell_totals,
+        cooccurrence_table,
+        eco_index,
+        eco_options,
+        eco_square_table,
+        filter_strata,
+        mate_square_table,
+        material_index,
+        piece_groups,
+        square_index,
+        stratified_sample,
+    )
+
+    tables = {
+        "mate_squares": mate_square_table(games),
+        "square_index": square_index(games, SQUARE_COLUMNS),
+        "cooccurrence": cooccurrence_table(
+            games, piece_groups(SQUARE_COLUMNS), cooccurrence_buckets(games), n_cooccurrence_buckets
+        ),
+    }
+    if progressive_setting == "1" or (
+        progressive_setting == "auto" and len(games) > progressive_min_rows
+    ):
+        sample = stratified_sample(filter_strata(games), sample_size)
+        sample["games"] = games.iloc[sample["rows"]].reset_index(drop=True)
+        tables["sample"] = sample
+    if "w_material" in games:
+        tables["material_index"] = material_index(
+            games["w_material"].to_numpy(), games["b_material"].to_numpy()
+        )
+    if "WhiteElo" in games and "BlackElo" in games:
+        tables["ratings"] = rating_table(games)
+    if "eco_code" in games:
+        n_codes = len(games["ECO"].cat.categories)
+        codes = games["eco_code"].to_numpy()
+        tables["eco_squares"] = eco_square_table(games, SQUARE_COLUMNS)
+        tables["eco_totals"] = cell_totals(
+            codes, n_codes, games["winner_code"].to_numpy(), games["moves"].to_numpy()
+        )
+        tables["eco_index"] = eco_index(codes, n_codes)
+        tables["eco_options"] = eco_options(games)
+    return tables
+
+
+def has_material():
+    """Whether the dataset has the endFEN column of the material filter."""
+    return is_ready() and "material_index" in _tables
+
+
+def has_ratings():
+    """Whether the dataset has the WhiteElo and BlackElo columns of the rating filters."""
+    return is_ready() and _tables.get("ratings") is not None
+
+
+def get_rating_bounds():
+    """Return the (first, stop) bounds of the ratings of both sides and the
+    largest rating difference, as in rating_table."""
+    ratings = get_table("ratings")
+    return ratings["bounds"], ratings["max_difference"]
+
+
+def has_openings():
+    """Whether the dataset has the ECO column of the opening filter."""
+    return is_ready() and "eco_squares" in _tables
+
+
+def _load():
+    global _games, _tables, _error, _indexing, _version
+    try:
+        path = resolve_data_path()
+        games = read_games(path)
+        _indexing = True
+        _games = build_indexes(games)
+        _tables = build_tables(_games)
+        _version = repr(
+            (
+                path,
+                os.stat(path).st_mtime_ns,
+                os.environ.get("CHESS_DATA_START"),
+                os.environ.get("CHESS_DATA_END"),
+                len(_games),
+            )
+        )
+    except Exception as e:
+        _error = e
+    finally:
+        _ready.set()
+
+
+def start_loading():
+    """Start loading the dataset in the background, once per process."""
+    global _thread
+    with _lock:
+        if _thread is None and not _ready.is_set():
+            _thread = threading.Thread(target=_load, name="dataset-loader", daemon=True)
+            _thread.start()
+
+
+def use_games(games):
+    """Serve games instead of loading the .csv.
+    Used by the benchmarks to run the app on synthetic data."""
+    global _games, _tables, _error, _version
+    with _lock:
+        _games, _error = build_indexes(games), None
+        _tables = build_tables(_games)
+        _version = uuid.uuid4().hex
+        _ready.set()
+
+
+def is_ready():
+    return _ready.is_set() and _error is None
+
+
+def status():
+    if not _ready.is_set():
+        return "indexing" if _indexing else "loading"
+    return "failed" if _error is not None else "ready"
+
+
+def get_data(timeout=None):
+    """Return the games DataFrame, waiting up to timeout seconds for it.
+    Returns None on timeout and re-raises the load error if loading failed."""
+    start_loading()
+    if not _ready.wait(timeout):
+        return None
+    if _error is not None:
+        raise _error
+    return _games
+
+
+def is_progressive():
+    """Whether approximate boards are computed first (see build_tables)."""
+    return is_ready() and "sample" in _tables
+
+
+def has_dates():
+    """Whether the dataset has the UTCDate column of the date filter."""
+    return is_ready() and "date_code" in _games
+
+
+def get_date_bounds():
+    """Return the first and last dates of the games, as YYYY-MM-DD."""
+    codes = get_data()["date_code"].to_numpy()
+    return str(np.datetime64(int(codes[0]), "D")), str(np.datetime64(int(codes[-1]), "D"))
+
+
+def date_rows(start=None, end=None):
+    """Slice of the rows of the games from start to end (YYYY-MM-DD, inclusive,
+    either may be None). Found by binary search on the sorted date_code."""
+    codes = get_data()["date_code"].to_numpy()
+    first = 0 if start is None else np.searchsorted(codes, date_code(start), "left")
+    last = len(codes) if end is None else np.searchsorted(codes, date_code(end), "right")
+    return slice(int(first), int(last))
+
+
+def get_table(name, timeout=None):
+    """Return a table of build_tables, waiting for the data like get_data."""
+    if get_data(timeout) is None:
+        return None
+    return _tables[name]
+
+
+def version():
+    """Identifies the loaded games, e.g. in the keys of saved results (see jobs.py)."""
+    get_data()
+    return _version
+
+
+def row_count():
+    return len(_games) if is_ready() else None
+
+
+def get_bounds():
+    """Return (min_elo, max_elo, max_moves) of the loaded dataset."""
+    games = get_data()
+    return games["avg_Elo"].min(), games["avg_Elo"].max(), games["moves"].max()
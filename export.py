@@ -0,0 +1,109 @@
+"""Export the selected games and board counts, as CSV or Parquet.
+
+The games are written a chunk of rows at a time from the filter mask, so an
+export of the whole dataset never holds more than chunk_rows rows in memory
+on top of the games. The output has the columns of the .csv read by
+dataset.py, with the squares as "(row, col)" strings again.
+Parquet needs pyarrow, which is optional: see has_parquet().
+"""
+import importlib.util
+import io
+
+import numpy as np
+
+from dataset import SQUARE_CODES, SQUARE_COLUMNS
+
+chunk_rows = 50000
+# Columns added by dataset.build_indexes, left out of the exports.
+INDEX_COLUMNS = ["winner_code", "status_code", "eco_code", "w_material", "b_material", "date_code"]
+# "(row, col)" strings by square code, with code -1 last.
+SQUARE_NAMES = np.array(sorted(SQUARE_CODES, key=lambda name: SQUARE_CODES[name] % 65))
+
+
+def has_parquet():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def game_columns(games):
+    return [column for column in games.columns if column not in INDEX_COLUMNS]
+
+
+def decoded(games, rows, columns):
+    """The games of rows, with the square columns decoded."""
+    frame = games.iloc[rows][columns]
+    for col in SQUARE_COLUMNS:
+        if col in frame and frame[col].dtype != object:
+            frame[col] = SQUARE_NAMES[frame[col].to_numpy()]
+    return frame
+
+
+def games_csv(games, rows, columns=None):
+    """Generate the CSV of the games of rows (an array of row numbers), a chunk at a time."""
+    columns = columns or game_columns(games)
+    yield ",".join(columns) + "\n"
+    for start in range(0, len(rows), chunk_rows):
+        yield decoded(games, rows[start : start + chunk_rows], columns).to_csv(
+            header=False, index=False
+        )
+
+
+class _Chunks:
+    # Output stream of ParquetWriter, emptied after each row group.
+    closed = False
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.position = 0
+
+    def write(self, data):
+        self.position += len(data)
+        return self.buffer.write(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+        return data
+
+
+def games_parquet(games, rows, columns=None):
+    """Generate the Parquet file of the games of rows, a row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = columns or game_columns(games)
+    schema = pa.Schema.from_pandas(decoded(games, rows[:0], columns), preserve_index=False)
+    # Object columns have no type when empty: they hold strings.
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    sink = _Chunks()
+    writer = pq.ParquetWriter(sink, schema)
+    for start in range(0, len(rows), chunk_rows):
+        frame = decoded(games, rows[start : start + chunk_rows], columns)
+        writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def board_frame(counts, labels):
+    """The 8*8 matrices of the boards, one row per rank from 8 to 1, in the
+    order of board_output."""
+    import pandas as pd
+
+    frames = []
+    for board, label in zip(counts, labels):
+        frame = pd.DataFrame(np.reshape(board, (8, 8)), columns=list("ABCDEFGH"))
+        frame.insert(0, "rank", range(8, 0, -1))
+        frame.insert(0, "board", label)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
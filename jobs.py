@@ -0,0 +1,188 @@
+"""Run expensive queries as background jobs.
+
+Long scans would otherwise block a server thread for the whole request. Instead
+the callback submits a job, returns, and the page polls the job's progress
+(see app.poll_board_job). Jobs run on a small local thread pool, which shares
+the dataset and caches of the process, and their results are saved in a
+directory of .npz files. The callback finds them there when it runs again,
+and so do later requests for the same query, from any worker.
+
+Job functions return a dict of arrays. They call checkpoint() now and then to
+report their progress; it raises JobCancelled once nobody waits for the job,
+e.g. when the filters changed since it was submitted.
+"""
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+workers = int(os.environ.get("CHESS_JOB_WORKERS", "2"))
+store_dir = os.environ.get(
+    "CHESS_JOB_DIR", os.path.join(tempfile.gettempdir(), "chess_app_jobs")
+)
+# Oldest results are deleted beyond this number.
+store_max_entries = int(os.environ.get("CHESS_JOB_STORE_ENTRIES", "256"))
+# Finished jobs kept for polling.
+max_jobs = 256
+
+_lock = threading.Lock()
+_executor = None
+_jobs = collections.OrderedDict()
+_running = {}
+_local = threading.local()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key, owner):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owners = {owner}
+        # queued, running, done, failed or cancelled.
+        self.state = "queued"
+        self.progress = 0.0
+        self.error = None
+        self.cancelled = threading.Event()
+        self.future = None
+        self.span = (0.0, 1.0)
+
+
+def submit(owner, key, function, *args):
+    """Run function(*args) in the background for owner (e.g. a session id) and
+    save its result under key. A job of the same key is shared rather than
+    started twice; the previous jobs of owner are cancelled."""
+    global _executor
+    with _lock:
+        job = _running.get(key)
+        if job is None:
+            job = Job(key, owner)
+            if load(key) is not None:
+                job.state, job.progress = "done", 1.0
+            else:
+                if _executor is None:
+                    _executor = concurrent.futures.ThreadPoolExecutor(
+                        workers, thread_name_prefix="chess-job"
+                    )
+                _running[key] = job
+                job.future = _executor.submit(_run, job, function, args)
+            _jobs[job.id] = job
+            while len(_jobs) > max_jobs:
+                _jobs.popitem(last=False)
+        job.owners.add(owner)
+    cancel(owner, keep=job)
+    return job
+
+
+def get(job_id):
+    return _jobs.get(job_id)
+
+
+def cancel(owner, keep=None):
+    """Stop waiting for the jobs of owner, except keep. Jobs nobody else
+    waits for are cancelled."""
+    with _lock:
+        for job in list(_running.values()):
+            if job is keep or owner not in job.owners:
+                continue
+            job.owners.discard(owner)
+            if not job.owners:
+                job.cancelled.set()
+                if job.future.cancel():
+                    _finish(job, "cancelled")
+
+
+def checkpoint(done=None, total=None):
+    """Report that done out of total units of the current job are done, and
+    raise JobCancelled if it was cancelled. Does nothing outside of jobs, so
+    it can be called from code that also runs in requests."""
+    job = getattr(_local, "job", None)
+    if job is None:
+        return
+    if done is not None and total:
+        start, end = job.span
+        job.progress = start + (end - start) * min(done / total, 1.0)
+    if job.cancelled.is_set():
+        raise JobCancelled(job.key)
+
+
+@contextlib.contextmanager
+def span(start, end):
+    """Map the progress reported within the block to start..end of the job."""
+    job = getattr(_local, "job", None)
+    if job is None:
+        yield
+        return
+    outer = job.span
+    job.span = (outer[0] + (outer[1] - outer[0]) * start, outer[0] + (outer[1] - outer[0]) * end)
+    try:
+        yield
+    finally:
+        job.span = outer
+        job.progress = max(job.progress, job.span[0] + (job.span[1] - job.span[0]) * end)
+
+
+def _run(job, function, args):
+    _local.job = job
+    job.state = "running"
+    try:
+        save(job.key, function(*args))
+    except JobCancelled:
+        state = "cancelled"
+    except Exception as e:
+        logger.exception("Job %s failed", job.key)
+        job.error = e
+        state = "failed"
+    else:
+        job.progress = 1.0
+        state = "done"
+    finally:
+        _local.job = None
+    with _lock:
+        _finish(job, state)
+
+
+def _finish(job, state):
+    job.state = state
+    if _running.get(job.key) is job:
+        del _running[job.key]
+
+
+# The result store: one .npz per key, named by its hash.
+def _path(key):
+    return os.path.join(store_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+
+def save(key, arrays):
+    os.makedirs(store_dir, exist_ok=True)
+    path = _path(key)
+    # Written under another name first, so readers never see a partial file.
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temporary, path)
+    entries = [os.path.join(store_dir, name) for name in os.listdir(store_dir)]
+    entries = sorted((e for e in entries if e.endswith(".npz")), key=os.path.getmtime)
+    for entry in entries[: max(len(entries) - store_max_entries, 0)]:
+        with contextlib.suppress(OSError):
+            os.remove(entry)
+
+
+def load(key):
+    """The saved result of key, or None."""
+    try:
+        with np.load(_path(key)) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+    except (OSError, ValueError):
+        return None
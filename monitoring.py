@@ -0,0 +1,227 @@
+"""Operational metrics, rendered in the Prometheus text format on /metrics.
+
+Metrics are kept per process: with several gunicorn workers each scrape
+reports the worker that answered it, as with any multi-process exporter.
+
+Setting CHESS_PROFILE=1 additionally times the stages of each callback (see
+StageTimer). Stage timings are logged on the "chess_app.timing" logger,
+exported as a histogram and returned in a Server-Timing response header.
+"""
+import bisect
+import json
+import logging
+import os
+import resource
+import threading
+import time
+
+from flask import Response, g, request
+
+PROFILE = os.environ.get("CHESS_PROFILE", "0") not in ("", "0")
+timing_logger = logging.getLogger("chess_app.timing")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1e3, 5e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    items = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + items + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in values.items()]
+
+
+class Gauge(Metric):
+    """A gauge whose value is read from a function at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function, kind="gauge"):
+        super().__init__(name, documentation)
+        self.function = function
+        # Counters maintained elsewhere (e.g. functools.lru_cache statistics)
+        # are exported through this class with kind="counter".
+        self.kind = kind
+
+    def render(self):
+        value = self.function()
+        if value is None:
+            return []
+        return [f"{self.name} {value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            values = {k: (list(c), s) for k, (c, s) in self._values.items()}
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(key + (("le", bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.header() + metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def resident_memory_bytes():
+    # Current RSS from /proc where available, peak RSS otherwise.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+callback_latency = Histogram(
+    "chess_callback_latency_seconds",
+    "Time spent answering a Dash callback request, by first output.",
+    LATENCY_BUCKETS,
+)
+callback_response_bytes = Histogram(
+    "chess_callback_response_bytes",
+    "Size of Dash callback response bodies, by first output.",
+    SIZE_BUCKETS,
+)
+process_memory = Gauge(
+    "process_resident_memory_bytes", "Resident memory of this worker.", resident_memory_bytes
+)
+stage_latency = Histogram(
+    "chess_stage_latency_seconds",
+    "Time spent in each stage of a callback, when CHESS_PROFILE is set.",
+    LATENCY_BUCKETS,
+)
+
+
+class StageTimer:
+    """Lap timer for the stages of a callback.
+
+    Call lap(name) at the end of each stage and done() before returning. Does
+    nothing unless profiling is enabled, so it can stay in the hot path.
+    """
+
+    def __init__(self, callback, enabled=None):
+        self.callback = callback
+        self.enabled = PROFILE if enabled is None else enabled
+        self.stages = []
+        if self.enabled:
+            self._last = time.perf_counter()
+
+    def lap(self, stage):
+        if self.enabled:
+            now = time.perf_counter()
+            self.stages.append((stage, now - self._last))
+            self._last = now
+
+    def done(self, **fields):
+        """Record the stages. Extra fields (e.g. the filters) are logged with them."""
+        if not self.enabled:
+            return
+        for stage, duration in self.stages:
+            stage_latency.observe(duration, callback=self.callback, stage=stage)
+        if request:
+            # Serialization happens in Dash after the callback returns, so it is
+            # timed from here to the end of the request (see instrument).
+            g.stages = g.get("stages", []) + self.stages
+            g.callback_end = time.perf_counter()
+            g.profiled_callback = self.callback
+        timing_logger.info(
+            json.dumps(
+                {
+                    "callback": self.callback,
+                    "stages_ms": {s: round(d * 1000, 3) for s, d in self.stages},
+                    **fields,
+                },
+                default=str,
+            )
+        )
+
+
+def callback_output():
+    """Label for the current callback request: its first output, e.g. "chessboard.figure"."""
+    body = request.get_json(silent=True) or {}
+    return body.get("output", "unknown").strip(".").split("...")[0]
+
+
+def instrument(server):
+    """Time Dash callback requests on server and expose /metrics."""
+
+    @server.before_request
+    def _start_timer():
+        if request.path.endswith("/_dash-update-component"):
+            g.callback_start = time.perf_counter()
+
+    @server.after_request
+    def _record_callback(response):
+        start = g.pop("callback_start", None)
+        if start is not None:
+            now = time.perf_counter()
+            output = callback_output()
+            callback_latency.observe(now - start, output=output)
+            if response.content_length is not None:
+                callback_response_bytes.observe(response.content_length, output=output)
+            if "callback_end" in g:
+                serialize = now - g.callback_end
+                stage_latency.observe(serialize, callback=g.profiled_callback, stage="serialize")
+                stages = g.stages + [("serialize", serialize), ("total", now - start)]
+                response.headers["Server-Timing"] = ", ".join(
+                    f"{stage};dur={duration * 1000:.2f}" for stage, duration in stages
+                )
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
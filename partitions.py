@@ -0,0 +1,99 @@
+"""Date-partitioned storage of the preprocessed dataset.
+
+A partitioned dataset is a directory with one .csv per month (or per day) of
+UTCDate, and a manifest describing them:
+    games/
+        _manifest.json
+        month=2017-03.csv
+        month=2017-04.csv
+It is written from a single .csv with a UTCDate column by
+    python partitions.py write chess_app.csv games/ [--by day]
+and loaded by pointing CHESS_DATA_PATH at the directory. With CHESS_DATA_START
+and/or CHESS_DATA_END (YYYY-MM-DD), only the partitions overlapping that range
+are read, so a year of games can be kept on disk and a few months served.
+"""
+import json
+import os
+import sys
+
+from data_source import DataSourceError
+
+MANIFEST = "_manifest.json"
+# Partition key of a UTCDate ("2017.04.01"), by granularity.
+KEY_LENGTHS = {"month": 7, "day": 10}
+CHUNK_ROWS = 500000
+
+
+def write_partitions(source, root, by="month", chunk_rows=CHUNK_ROWS):
+    """Split the .csv at source into partitions under root, which must not
+    already hold a partitioned dataset. The source is read in chunks, so it
+    does not need to fit in memory. Returns the manifest."""
+    import pandas as pd
+
+    if by not in KEY_LENGTHS:
+        raise ValueError(f"Unknown partitioning {by!r}, expected one of {list(KEY_LENGTHS)}")
+    if os.path.exists(os.path.join(root, MANIFEST)):
+        raise DataSourceError(f"{root} already holds a partitioned dataset")
+    os.makedirs(root, exist_ok=True)
+
+    partitions = {}
+    for chunk in pd.read_csv(source, chunksize=chunk_rows):
+        if "UTCDate" not in chunk:
+            raise DataSourceError(f"{source} has no UTCDate column to partition by")
+        keys = chunk["UTCDate"].str.slice(0, KEY_LENGTHS[by]).str.replace(".", "-", regex=False)
+        for key, games in chunk.groupby(keys, sort=True):
+            name = f"{by}={key}.csv"
+            entry = partitions.setdefault(
+                key, {"file": name, "rows": 0, "first": None, "last": None}
+            )
+            games.to_csv(
+                os.path.join(root, name), mode="a", header=entry["rows"] == 0, index=False
+            )
+            first = games["UTCDate"].min().replace(".", "-")
+            last = games["UTCDate"].max().replace(".", "-")
+            entry["rows"] += len(games)
+            entry["first"] = min(first, entry["first"] or first)
+            entry["last"] = max(last, entry["last"] or last)
+
+    manifest = {"by": by, "partitions": [partitions[key] for key in sorted(partitions)]}
+    # Written last: a directory without a manifest is an incomplete write.
+    with open(os.path.join(root, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise DataSourceError(f"{root} is not a partitioned dataset: {e}") from e
+
+
+def select_partitions(root, start=None, end=None):
+    """Paths of the partitions holding games from start to end (YYYY-MM-DD,
+    inclusive, either may be None), in date order. The others are pruned
+    from the manifest alone, without opening their files."""
+    selected = [
+        partition
+        for partition in load_manifest(root)["partitions"]
+        if (start is None or partition["last"] >= start)
+        and (end is None or partition["first"] <= end)
+    ]
+    if not selected:
+        raise DataSourceError(f"No partition of {root} has games from {start} to {end}")
+    return [os.path.join(root, partition["file"]) for partition in selected]
+
+
+if __name__ == "__main__":
+    # Usage: python partitions.py write SOURCE.csv DIRECTORY [--by month|day]
+    args = sys.argv[1:]
+    by = "month"
+    if "--by" in args:
+        position = args.index("--by")
+        by = args[position + 1]
+        del args[position : position + 2]
+    if len(args) != 3 or args[0] != "write":
+        sys.exit("Usage: python partitions.py write SOURCE.csv DIRECTORY [--by month|day]")
+    manifest = write_partitions(args[1], args[2], by)
+    print(f"{len(manifest['partitions'])} partitions written to {args[2]}")
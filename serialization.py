@@ -0,0 +1,108 @@
+"""Compact serialization of the figures sent in callback responses.
+
+compact_figure turns a figure into a plain dict that Dash can encode with
+the C json encoder (no to_plotly_json or numpy fallbacks at encode time):
+    - numeric arrays are rounded, and integer valued ones sent as ints,
+    - the template only keeps the trace types that the figure uses,
+    - with CHESS_TYPED_ARRAYS=1, x/y/marker.size are sent as base64 typed
+      arrays. This needs plotly.js >= 2.28 in the browser (dash >= 2.15).
+Responses are encoded with orjson when it is installed (see FastJSONEncoder),
+and compressed with brotli or gzip (see app.py).
+"""
+import base64
+import os
+
+import numpy as np
+import plotly.utils
+
+try:
+    import orjson
+except ImportError:  # optional: responses are then encoded by PlotlyJSONEncoder
+    orjson = None
+
+TYPED_ARRAYS = os.environ.get("CHESS_TYPED_ARRAYS", "0") not in ("", "0")
+# Attributes that plotly.js accepts as typed arrays.
+TYPED_ARRAY_KEYS = {"x", "y", "size"}
+
+
+def typed_array(values):
+    """Encode a numeric array in the plotly.js typed array format."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iu" and values.size:
+        # Use the narrowest integer type holding the values.
+        dtype = np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max()))
+    else:
+        dtype = np.dtype("f4")
+    dtype = dtype.newbyteorder("<")
+    return {
+        "dtype": dtype.str[1:],
+        "bdata": base64.b64encode(values.astype(dtype).tobytes()).decode(),
+    }
+
+
+def _numeric(values):
+    if isinstance(values, np.ndarray):
+        return values if values.dtype.kind in "iuf" else None
+    if isinstance(values, (list, tuple)) and values and all(
+        isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values
+    ):
+        return np.asarray(values)
+    return None
+
+
+def compact_arrays(container, decimals, typed_arrays):
+    """Round or encode the numeric arrays of a trace (or of a nested dict) in place."""
+    for key, value in container.items():
+        if isinstance(value, dict):
+            compact_arrays(value, decimals, typed_arrays)
+            continue
+        values = _numeric(value)
+        if values is None:
+            continue
+        if values.dtype.kind == "f":
+            values = np.round(values, decimals)
+            if np.all(values == np.floor(values)):
+                values = values.astype(np.int64)
+        if typed_arrays and key in TYPED_ARRAY_KEYS:
+            container[key] = typed_array(values)
+        else:
+            container[key] = values.tolist()
+
+
+def compact_figure(figure, decimals=2, typed_arrays=None):
+    """Return figure as a compact plain dict. The figure must not be reused."""
+    typed_arrays = TYPED_ARRAYS if typed_arrays is None else typed_arrays
+    fig = figure.to_plotly_json() if hasattr(figure, "to_plotly_json") else figure
+    fig = {"data": [dict(trace) for trace in fig["data"]], "layout": dict(fig["layout"])}
+
+    template = fig["layout"].get("template")
+    if template is not None and not isinstance(template, str):
+        template = template.to_plotly_json() if hasattr(template, "to_plotly_json") else template
+        used = {trace.get("type", "scatter") for trace in fig["data"]}
+        template = dict(template)
+        template["data"] = {k: v for k, v in template.get("data", {}).items() if k in used}
+        fig["layout"]["template"] = template
+
+    for trace in fig["data"]:
+        compact_arrays(trace, decimals, typed_arrays)
+    return fig
+
+
+class FastJSONEncoder(plotly.utils.PlotlyJSONEncoder):
+    """PlotlyJSONEncoder that encodes with orjson, about ten times faster, when
+    it is installed. Objects orjson does not know (figures, Dash components...)
+    go through PlotlyJSONEncoder.default. NaN and infinities become null, as
+    with PlotlyJSONEncoder."""
+
+    def encode(self, o):
+        if orjson is None or self.indent is not None or self.sort_keys:
+            return super().encode(o)
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(o, default=self.default, option=option).decode()
+
+
+def use_fast_json():
+    """Encode the responses of Dash with FastJSONEncoder. Dash 1.x has no
+    setting for its encoder: it looks up plotly.utils.PlotlyJSONEncoder on
+    each response."""
+    plotly.utils.PlotlyJSONEncoder = FastJSONEncoder
@@ -0,0 +1,232 @@
+"""Static export of the app, for hosting on a CDN without a server.
+
+    python static_site.py build OUTPUT_DIR [--elo-step 200] [--moves-edges 0,20,40,...]
+                                           [--local-plotlyjs]
+
+precomputes the boards of every combination of the STATUS, WINNER, TIME
+CONTROL and GAME TYPE menus, for every piece, and writes them with a front end
+(static_viewer/) that fetches them as the menus change:
+    OUTPUT_DIR/
+        index.html
+        viewer.js
+        manifest.json        menus, buckets, figure templates, shards of each view
+        shards/<hash>.json
+The boards of a view are counted by Elo bucket and moves bucket, and the front
+end sums the buckets of the selected ranges, so the Elo and moves ranges are
+chosen among the bucket edges. Shards are named by the hash of their content:
+boards that are the same in several views (e.g. draws, whatever the winner) are
+stored once. The dataset is the one the app loads (see dataset.py).
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+VIEWER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static_viewer")
+elo_step = 200
+moves_edges = [0, 10, 20, 30, 40, 50, 60, 80, 100, 150]
+
+# Labels of the menu values (the patterns of app.st_dict etc.) in the front end.
+MENU_LABELS = {
+    "status": {
+        ".*": "All",
+        "draw": "Draw",
+        "mate": "Checkmate",
+        "resign": "Resignation",
+        "outoftime": "Time forfeit",
+    },
+    "winner": {".*": "All", "white": "White", "black": "Black"},
+    "time_control": {
+        ".*": "All",
+        "Bullet": "Bullet",
+        "Blitz": "Blitz",
+        "Classical": "Classical",
+        "Correspondence": "No time control",
+    },
+    "game_type": {".*": "All", "game": "Standard", "tournament": "Tournament"},
+}
+
+
+def bucket_edges(values, edges):
+    """edges below the highest value, closed by a last edge above it."""
+    edges = [int(e) for e in edges if e <= values.max()]
+    return edges + [int(values.max()) + 1]
+
+
+def pattern_classes(values, patterns):
+    """Group values by the patterns of app.select_games they contain.
+    Returns the class of each value and, by class, which patterns match (a
+    boolean array classes * patterns). The patterns are only tested once per
+    distinct value."""
+    categories = pd.Series(values, dtype="category")
+    names = categories.cat.categories.to_series()
+    matches = np.column_stack([names.str.contains(p).to_numpy() for p in patterns])
+    matches, classes = np.unique(matches, axis=0, return_inverse=True)
+    return classes.ravel()[categories.cat.codes.to_numpy()], matches
+
+
+def shard_json(counts):
+    """Shard of an array of counts: the gaps between the flat indexes of its
+    nonzero counts, and these counts. Sparse boards take little space, and
+    every shard decodes the same way."""
+    flat = counts.ravel()
+    index = np.flatnonzero(flat)
+    gaps = np.diff(index, prepend=-1)
+    shard = {"gaps": gaps.tolist(), "counts": flat[index].tolist()}
+    return json.dumps(shard, separators=(",", ":"))
+
+
+def build(output, elo_step=elo_step, moves_edges=moves_edges, local_plotlyjs=False):
+    import plotly.offline
+    import plotly.utils
+
+    import app
+    import dataset
+    from chessboard import (
+        HEATMAP_X,
+        HEATMAP_Y,
+        getChessboardDict,
+        heatmapTemplate,
+        stackedBarTemplate,
+    )
+
+    games = dataset.get_data()
+    menus = {
+        "status": ("victory_status", list(app.st_dict.values())),
+        "winner": ("Winner", list(app.wn_dict.values())),
+        "time_control": ("Event", list(app.tc_dict.values())),
+        "game_type": ("Event", list(app.gt_dict.values())),
+    }
+
+    # Games are grouped by which menu values they match: an atom is a class of
+    # victory_status, of Winner and of Event. Views are unions of atoms.
+    atoms = np.zeros(len(games), dtype=np.int64)
+    matches = {}
+    for column in ["victory_status", "Winner", "Event"]:
+        patterns = [(f, p) for f, (c, values) in menus.items() if c == column for p in values]
+        classes, column_matches = pattern_classes(games[column], [p for _, p in patterns])
+        atoms = atoms * len(column_matches) + classes
+        matches[column] = (patterns, column_matches)
+    atoms, atom_of_game = np.unique(atoms, return_inverse=True)
+    n_atoms = len(atoms)
+    # Which menu values each atom matches, back from its classes.
+    atom_matches = {}
+    for column in ["Event", "Winner", "victory_status"]:
+        patterns, column_matches = matches[column]
+        classes = atoms % len(column_matches)
+        atoms = atoms // len(column_matches)
+        for i, key in enumerate(patterns):
+            atom_matches[key] = column_matches[classes, i]
+
+    first_elo = int(games["avg_Elo"].min()) // elo_step * elo_step
+    elo = bucket_edges(games["avg_Elo"].to_numpy(), range(first_elo, 4000, elo_step))
+    moves = bucket_edges(games["moves"].to_numpy(), moves_edges)
+    n_elo, n_moves = len(elo) - 1, len(moves) - 1
+    cell = (
+        atom_of_game.ravel() * n_elo
+        + np.searchsorted(elo, games["avg_Elo"].to_numpy(), side="right") - 1
+    ) * n_moves + np.searchsorted(moves, games["moves"].to_numpy(), side="right") - 1
+
+    # Counts by atom, bucket and square (or result), in one pass per piece.
+    results = np.bincount(
+        cell * 3 + games["winner_code"].to_numpy(), minlength=n_atoms * n_elo * n_moves * 3
+    ).reshape(n_atoms, n_elo, n_moves, 3)
+    pieces = list(app.cp_dict)
+    boards = []
+    for key in pieces:
+        counts = np.zeros(n_atoms * n_elo * n_moves * 64, dtype=np.int64)
+        for column in app.cp_dict[key]:
+            squares = games[column].to_numpy()
+            on_board = squares >= 0
+            counts += np.bincount(
+                cell[on_board] * 64 + squares[on_board], minlength=len(counts)
+            )
+        boards.append(counts.reshape(n_atoms, n_elo, n_moves, 64))
+
+    os.makedirs(os.path.join(output, "shards"), exist_ok=True)
+    written = set()
+
+    def write_shard(counts):
+        text = shard_json(counts)
+        name = hashlib.sha1(text.encode()).hexdigest()[:16]
+        if name not in written:
+            with open(os.path.join(output, "shards", name + ".json"), "w") as f:
+                f.write(text)
+            written.add(name)
+        return name
+
+    views = {}
+    fields = list(menus)
+    for combination in np.ndindex(*[len(menus[f][1]) for f in fields]):
+        values = [menus[f][1][i] for f, i in zip(fields, combination)]
+        selected = np.ones(n_atoms, dtype=bool)
+        for field, value in zip(fields, values):
+            if value != ".*":
+                selected &= atom_matches[field, value]
+        views["|".join(values)] = {
+            "results": write_shard(results[selected].sum(axis=0)),
+            "boards": [write_shard(b[selected].sum(axis=0)) for b in boards],
+        }
+
+    manifest = {
+        "version": dataset.version(),
+        "games": len(games),
+        "elo_edges": elo,
+        "moves_edges": moves,
+        "menus": [
+            {"field": f, "options": [[v, MENU_LABELS[f][v]] for v in menus[f][1]]} for f in fields
+        ],
+        "pieces": [[color, piece] for color, piece in pieces],
+        "views": views,
+        "figures": {
+            "chessboard": getChessboardDict(app.board_dimensions),
+            "heatmap": dict(heatmapTemplate(), x=HEATMAP_X.tolist(), y=HEATMAP_Y.tolist()),
+            "stackedbar": stackedBarTemplate(),
+            "max_size": app.heatmap_max_size,
+        },
+    }
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        # The figure templates may hold numpy arrays.
+        json.dump(manifest, f, separators=(",", ":"), cls=plotly.utils.PlotlyJSONEncoder)
+
+    if local_plotlyjs:
+        with open(os.path.join(output, "plotly.min.js"), "w") as f:
+            f.write(plotly.offline.get_plotlyjs())
+        plotly_src = "plotly.min.js"
+    else:
+        plotly_src = f"https://cdn.plot.ly/plotly-{plotly.offline.get_plotlyjs_version()}.min.js"
+    with open(os.path.join(VIEWER, "index.html")) as f:
+        page = f.read().replace("PLOTLY_SRC", plotly_src)
+    with open(os.path.join(output, "index.html"), "w") as f:
+        f.write(page)
+    shutil.copy(os.path.join(VIEWER, "viewer.js"), output)
+    return manifest, len(written)
+
+
+if __name__ == "__main__":
+    # Usage: python static_site.py build OUTPUT_DIR [--elo-step N] [--moves-edges A,B,...]
+    #                                               [--local-plotlyjs]
+    args = sys.argv[1:]
+    options = {}
+    if "--local-plotlyjs" in args:
+        args.remove("--local-plotlyjs")
+        options["local_plotlyjs"] = True
+    for flag, name, parse in [
+        ("--elo-step", "elo_step", int),
+        ("--moves-edges", "moves_edges", lambda text: [int(e) for e in text.split(",")]),
+    ]:
+        if flag in args:
+            position = args.index(flag)
+            options[name] = parse(args[position + 1])
+            del args[position : position + 2]
+    if len(args) != 2 or args[0] != "build":
+        sys.exit(
+            "Usage: python static_site.py build OUTPUT_DIR "
+            "[--elo-step N] [--moves-edges A,B,...] [--local-plotlyjs]"
+        )
+    manifest, n_shards = build(args[1], **options)
+    print(f"{len(manifest['views'])} views, {n_shards} shards written to {args[1]}")
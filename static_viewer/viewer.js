@@ -0,0 +1,152 @@
+// Front end of the static export (see static_site.py): the same board and
+// results bar as the app, from the shards listed in manifest.json.
+"use strict";
+
+let manifest = null;
+// Decoded shards by name, fetched once.
+const shards = new Map();
+
+function fetchShard(name) {
+    if (!shards.has(name)) {
+        shards.set(
+            name,
+            fetch(`shards/${name}.json`)
+                .then((response) => response.json())
+                .then(decodeShard)
+        );
+    }
+    return shards.get(name);
+}
+
+// Flat indexes of the nonzero counts, from the gaps between them.
+function decodeShard(shard) {
+    const index = new Array(shard.gaps.length);
+    let last = -1;
+    shard.gaps.forEach((gap, i) => {
+        last += gap;
+        index[i] = last;
+    });
+    return { index: index, counts: shard.counts };
+}
+
+// Sum of the (elo bucket, moves bucket, size) counts of a shard over the
+// selected buckets.
+function bucketSum(shard, size, elo, moves) {
+    const nMoves = manifest.moves_edges.length - 1;
+    const total = new Array(size).fill(0);
+    shard.index.forEach((index, i) => {
+        const cell = Math.floor(index / size);
+        const e = Math.floor(cell / nMoves);
+        const m = cell % nMoves;
+        if (e >= elo[0] && e < elo[1] && m >= moves[0] && m < moves[1]) {
+            total[index % size] += shard.counts[i];
+        }
+    });
+    return total;
+}
+
+function makeSelect(label, options, onChange) {
+    const element = document.createElement("label");
+    element.textContent = label;
+    const select = document.createElement("select");
+    options.forEach(([value, text]) => select.add(new Option(text, value)));
+    select.addEventListener("change", onChange);
+    element.appendChild(select);
+    document.getElementById("menus").appendChild(element);
+    return select;
+}
+
+function edgeOptions(edges) {
+    return edges.map((edge, i) => [i, String(edge)]);
+}
+
+function selection(controls) {
+    const range = (first, last) => [Number(first.value), Number(last.value)];
+    return {
+        view: manifest.menus.map((menu) => controls[menu.field].value).join("|"),
+        piece: Number(controls.piece.value),
+        elo: range(controls.elo_min, controls.elo_max),
+        moves: range(controls.moves_min, controls.moves_max),
+    };
+}
+
+function heatmapTrace(counts) {
+    const total = counts.reduce((a, b) => a + b, 0);
+    const freq = counts.map((n) => (total ? Math.round((n / total) * 1e4) / 100 : 0));
+    const trace = JSON.parse(JSON.stringify(manifest.figures.heatmap));
+    trace.hovertext = counts;
+    trace.marker.size = freq;
+    // As chessboard.getHeatmapDict: a board with no pieces gets a positive sizeref.
+    const max = Math.max(...freq);
+    trace.marker.sizeref = max ? max / manifest.figures.max_size : 1;
+    return trace;
+}
+
+function stackedBar(white, black, draw) {
+    const template = manifest.figures.stackedbar;
+    const total = white + black + draw;
+    const data = [];
+    // Traces in the order of chessboard.getStackedBar.
+    template.data.forEach((trace, i) => {
+        const count = [black, draw, white][i];
+        if (count > 0) {
+            data.push(Object.assign({}, trace, { x: [Math.round((count / total) * 1e4) / 100] }));
+        }
+    });
+    return { data: data, layout: template.layout };
+}
+
+async function update(controls) {
+    const selected = selection(controls);
+    if (selected.elo[0] >= selected.elo[1] || selected.moves[0] >= selected.moves[1]) {
+        document.getElementById("summary").textContent = "Empty range.";
+        return;
+    }
+    const view = manifest.views[selected.view];
+    const [results, board] = await Promise.all([
+        fetchShard(view.results),
+        fetchShard(view.boards[selected.piece]),
+    ]);
+    // A newer selection was made while the shards were fetched.
+    if (selection(controls).view !== selected.view || Number(controls.piece.value) !== selected.piece) {
+        return;
+    }
+    const [white, black, draw] = bucketSum(results, 3, selected.elo, selected.moves);
+    const counts = bucketSum(board, 64, selected.elo, selected.moves);
+    const games = white + black + draw;
+    document.getElementById("summary").textContent = `${games} games`;
+    if (games === 0) {
+        return;
+    }
+    const chessboard = manifest.figures.chessboard;
+    Plotly.react(
+        "chessboard",
+        chessboard.data.concat([heatmapTrace(counts)]),
+        chessboard.layout,
+        { displayModeBar: false }
+    );
+    const bar = stackedBar(white, black, draw);
+    Plotly.react("stackedbar", bar.data, bar.layout, { displayModeBar: false });
+}
+
+async function main() {
+    manifest = await (await fetch("manifest.json")).json();
+    const controls = {};
+    const onChange = () => update(controls);
+    const pieces = manifest.pieces.map(([color, piece], i) => [i, `${color.split("_")[0]} ${piece}`]);
+    controls.piece = makeSelect("Piece", pieces, onChange);
+    manifest.menus.forEach((menu) => {
+        controls[menu.field] = makeSelect(menu.field.replace("_", " "), menu.options, onChange);
+    });
+    const elo = edgeOptions(manifest.elo_edges);
+    const moves = edgeOptions(manifest.moves_edges);
+    controls.elo_min = makeSelect("Elo from", elo.slice(0, -1), onChange);
+    controls.elo_max = makeSelect("Elo below", elo.slice(1), onChange);
+    controls.moves_min = makeSelect("Moves from", moves.slice(0, -1), onChange);
+    controls.moves_max = makeSelect("Moves below", moves.slice(1), onChange);
+    controls.elo_max.value = elo.length - 1;
+    controls.moves_max.value = moves.length - 1;
+    update(controls);
+}
+
+main();